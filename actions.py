@@ -0,0 +1,16 @@
+# Player and timer actions, shared by the input loop, replays and bots
+NONE = 0
+MOVE_LEFT = 1
+MOVE_RIGHT = 2
+ROTATE = 3
+SOFT_DROP = 4
+HARD_DROP = 5
+HOLD = 6
+GRAVITY = 7  # soft drop triggered by the game timer rather than the player
+ROTATE_CCW = 8
+ROTATE_180 = 9
+
+ACTION_BITS = 4  # number of bits needed to store any action
+
+ACTION_NAMES = ("none", "move_left", "move_right", "rotate", "soft_drop", "hard_drop", "hold", "gravity", "rotate_ccw",
+                "rotate_180")
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+import pygame
+
+RESOURCES = "resources"
+FONT = "PressStart2P-Regular.ttf"
+MUSIC = "music.mp3"
+
+# Every asset is loaded once per process and shared, whichever thread asks for it first does the loading
+_cache = {}
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class StartupTimer:
+    # Milliseconds from launch to each named point of startup. started is a time.perf_counter() value taken as
+    # early as possible, before pygame is imported
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, (time.perf_counter() - self.started) * 1000))
+
+    def report(self):
+        return "startup: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.marks)
+
+
+def _cached(key, load):
+    value = _cache.get(key)
+    if value is not None:
+        return value
+    with _locks_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        value = _cache.get(key)
+        if value is None:
+            value = _cache[key] = load()
+    return value
+
+
+def path(name):
+    return os.path.join(RESOURCES, name)
+
+
+def init():
+    # Only the pygame modules the game draws with. pygame.init() would also bring up joysticks and the audio
+    # device; audio is started by the first sound instead, which preload() does off the main thread
+    pygame.display.init()
+    pygame.font.init()
+
+
+def init_audio():
+    # Whether there is audio. Without an audio device sounds and music are left out rather than failing
+    def start():
+        try:
+            pygame.mixer.init()
+        except pygame.error:
+            return False
+        return True
+    return _cached(("audio",), start)
+
+
+def font(size, name=FONT):
+    return _cached(("font", name, size), lambda: pygame.font.Font(path(name), size))
+
+
+def image(name):
+    return _cached(("image", name), lambda: pygame.image.load(path(name)))
+
+
+def sound(name):
+    # None without audio
+    if not init_audio():
+        return None
+    return _cached(("sound", name), lambda: pygame.mixer.Sound(path(name)))
+
+
+def load_music(name=MUSIC):
+    # Music is optional, returns whether it was loaded. Loading opens and starts decoding the file, which is what
+    # made starting the first game hitch
+    def load():
+        if not init_audio() or not os.path.exists(path(name)):
+            return False
+        pygame.mixer.music.load(path(name))
+        return True
+    return _cached(("music", name), load)
+
+
+def preload(sounds=(), music=None, play=None, timer=None):
+    # Loads sounds in the given order and then music on a background thread, which is returned. The sound named
+    # play is played as soon as it is loaded. Anything asked for before the thread got to it is loaded right
+    # away by the caller instead, and never twice. A StartupTimer given as timer is marked once all is loaded
+    def load():
+        for name in sounds:
+            loaded = sound(name)
+            if name == play and loaded is not None:
+                loaded.play()
+        if music is not None:
+            load_music(music)
+        if timer is not None:
+            timer.mark("assets loaded")
+
+    thread = threading.Thread(target=load, name="preload", daemon=True)
+    thread.start()
+    return thread
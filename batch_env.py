@@ -0,0 +1,272 @@
+import numpy as np
+from actions import GRAVITY, HARD_DROP, HOLD, MOVE_LEFT, MOVE_RIGHT, ROTATE, ROTATE_180, ROTATE_CCW, SOFT_DROP
+from rotation import KICKS
+from utilities import NUM_COLS, NUM_ROWS, SHAPES, spawn_shift
+
+QUEUE_SIZE = 5
+
+# Shape tables indexed by [block id, rotation, cell] -> (row, column). Blocks with fewer rotations repeat their
+# last one, NUM_ROTATIONS keeps the real count so rotation wraps the same way Block.rotate does
+NUM_ROTATIONS = np.zeros(len(SHAPES) + 1, dtype=np.int64)
+SHAPE_CELLS = np.zeros((len(SHAPES) + 1, 4, 4, 2), dtype=np.int64)
+for _block_id, _rotations in SHAPES.items():
+    NUM_ROTATIONS[_block_id] = len(_rotations)
+    for _rotation in range(4):
+        SHAPE_CELLS[_block_id, _rotation] = _rotations[min(_rotation, len(_rotations) - 1)]
+NUM_ROTATIONS[0] = 1
+
+# SRS kicks indexed by [block id, rotation, turns, kick] -> (row, column). Shorter kick lists repeat their last
+# kick, which cannot change which kick fits first
+MAX_KICKS = max(len(offsets) for table in KICKS.values() for turns in table for offsets in turns)
+KICK_OFFSETS = np.zeros((len(SHAPES) + 1, 4, 4, MAX_KICKS, 2), dtype=np.int64)
+for _block_id, _table in KICKS.items():
+    for _rotation, _turns in enumerate(_table):
+        for _turn, _offsets in enumerate(_turns):
+            KICK_OFFSETS[_block_id, _rotation, _turn] = _offsets + (_offsets[-1],) * (MAX_KICKS - len(_offsets))
+
+# Spawn (row, column) offsets per block id on a standard board, matching the block constructors
+SPAWN_ROWS = np.array([0, 0, 0, -1, 0, 0, 0, 0], dtype=np.int64)
+SPAWN_COLUMNS = np.array([0, 3, 3, 3, 4, 3, 3, 3], dtype=np.int64)
+
+
+class BatchEnv:
+    # Runs num_games games in lockstep on NumPy arrays, following the rules of Game action by action.
+    # Every step takes one action per game; finished games are reset automatically when auto_reset is set
+    def __init__(self, num_games, seed=None, auto_reset=True, num_rows=NUM_ROWS, num_cols=NUM_COLS):
+        self.num_games = num_games
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.spawn_shift = spawn_shift(num_cols)
+        self.auto_reset = auto_reset
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((num_games, num_rows, num_cols), dtype=np.uint8)
+        self.kind = np.zeros(num_games, dtype=np.int64)
+        self.rotation = np.zeros(num_games, dtype=np.int64)
+        self.row = np.zeros(num_games, dtype=np.int64)
+        self.column = np.zeros(num_games, dtype=np.int64)
+        self.hold = np.zeros(num_games, dtype=np.int64)
+        self.hold_rotation = np.zeros(num_games, dtype=np.int64)
+        self.hold_swapped = np.zeros(num_games, dtype=bool)
+        self.queue = np.zeros((num_games, QUEUE_SIZE), dtype=np.int64)
+        self.queue_length = np.zeros(num_games, dtype=np.int64)
+        self.bag = np.zeros((num_games, len(SHAPES)), dtype=bool)
+        self.score = np.zeros(num_games, dtype=np.int64)
+        self.previous_lines_cleared = np.zeros(num_games, dtype=np.int64)
+        self.combo_count = np.zeros(num_games, dtype=np.int64)
+        self.game_over = np.zeros(num_games, dtype=bool)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.reset_games(np.arange(self.num_games))
+        return self.observe()
+
+    def reset_games(self, games):
+        self.boards[games] = 0
+        self.bag[games] = True
+        self.hold[games] = 0
+        self.hold_rotation[games] = 0
+        self.hold_swapped[games] = False
+        self.score[games] = 0
+        self.previous_lines_cleared[games] = 0
+        self.combo_count[games] = 0
+        self.game_over[games] = False
+        self.set_current(games, self.draw_blocks(games))
+        self.queue_length[games] = 0
+        for _ in range(QUEUE_SIZE):
+            self.push_queue(games, self.draw_blocks(games))
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        live = ~self.game_over
+        score_before = self.score.copy()
+        handlers = (
+            (MOVE_LEFT, lambda games: self.shift(games, -1)),
+            (MOVE_RIGHT, lambda games: self.shift(games, 1)),
+            (ROTATE, self.rotate),
+            (ROTATE_CCW, lambda games: self.rotate(games, 3)),
+            (ROTATE_180, lambda games: self.rotate(games, 2)),
+            (SOFT_DROP, self.soft_drop),
+            (GRAVITY, self.soft_drop),
+            (HARD_DROP, self.hard_drop),
+            (HOLD, self.hold_block),
+        )
+        for action, handler in handlers:
+            games = np.flatnonzero(live & (actions == action))
+            if games.size:
+                handler(games)
+
+        rewards = self.score - score_before
+        dones = self.game_over & live
+        info = {"final_score": np.where(dones, self.score, 0)}
+        if self.auto_reset and dones.any():
+            self.reset_games(np.flatnonzero(dones))
+        return self.observe(), rewards, dones, info
+
+    def observe(self):
+        return {
+            "board": self.boards.copy(),
+            "piece": np.stack([self.kind, self.rotation, self.row, self.column], axis=1),
+            "hold": self.hold.copy(),
+            "queue": self.queue.copy(),
+        }
+
+    def fits(self, games, kind, rotation, row, column):
+        cells = SHAPE_CELLS[kind, rotation]
+        rows = cells[..., 0] + row[:, None]
+        columns = cells[..., 1] + column[:, None]
+        inside = (rows >= 0) & (rows < self.num_rows) & (columns >= 0) & (columns < self.num_cols)
+        occupied = self.boards[games[:, None], rows.clip(0, self.num_rows - 1), columns.clip(0, self.num_cols - 1)] != 0
+        return (inside & ~occupied).all(axis=1)
+
+    def fits_current(self, games):
+        return self.fits(games, self.kind[games], self.rotation[games], self.row[games], self.column[games])
+
+    def draw_blocks(self, games):
+        # Same 7-bag as Game.get_random_block: refill when empty, then take a random remaining block
+        empty = ~self.bag[games].any(axis=1)
+        self.bag[games[empty]] = True
+        remaining = self.bag[games]
+        picks = (self.rng.random(games.size) * remaining.sum(axis=1)).astype(np.int64)
+        index = (remaining.cumsum(axis=1) > picks[:, None]).argmax(axis=1)
+        self.bag[games, index] = False
+        return index + 1
+
+    def set_current(self, games, kind):
+        self.kind[games] = kind
+        self.rotation[games] = 0
+        self.row[games] = SPAWN_ROWS[kind]
+        self.column[games] = SPAWN_COLUMNS[kind] + self.spawn_shift
+
+    def push_queue(self, games, kind):
+        self.queue[games, self.queue_length[games]] = kind
+        self.queue_length[games] += 1
+
+    def pop_queue(self, games):
+        kind = self.queue[games, 0]
+        self.queue[games, :-1] = self.queue[games, 1:]
+        self.queue[games, -1] = 0
+        self.queue_length[games] -= 1
+        return kind
+
+    def shift(self, games, columns):
+        valid = self.fits(games, self.kind[games], self.rotation[games], self.row[games],
+                          self.column[games] + columns)
+        self.column[games[valid]] += columns
+
+    def rotate(self, games, turns=1):
+        # Same as Game.rotate: every game takes the first of its SRS kicks that fits
+        kind = self.kind[games]
+        rotation = self.rotation[games]
+        row = self.row[games]
+        column = self.column[games]
+        rotated = (rotation + turns) % NUM_ROTATIONS[kind]
+        kicks = KICK_OFFSETS[kind, rotation, turns]
+        turned = np.zeros(games.size, dtype=bool)
+        row_kick = np.zeros(games.size, dtype=np.int64)
+        column_kick = np.zeros(games.size, dtype=np.int64)
+        for index in range(MAX_KICKS):
+            fits = ~turned & self.fits(games, kind, rotated, row + kicks[:, index, 0], column + kicks[:, index, 1])
+            row_kick[fits] = kicks[fits, index, 0]
+            column_kick[fits] = kicks[fits, index, 1]
+            turned |= fits
+            if turned.all():
+                break
+
+        self.rotation[games[turned]] = rotated[turned]
+        self.row[games[turned]] += row_kick[turned]
+        self.column[games[turned]] += column_kick[turned]
+
+    def soft_drop(self, games):
+        valid = self.fits(games, self.kind[games], self.rotation[games], self.row[games] + 1, self.column[games])
+        self.row[games[valid]] += 1
+        if not valid.all():
+            self.place(games[~valid])
+
+    def hard_drop(self, games):
+        kind = self.kind[games]
+        rotation = self.rotation[games]
+        row = self.row[games]
+        column = self.column[games]
+
+        # Check every drop distance at once and stop at the first one that collides
+        distances = np.arange(1, self.num_rows + 2)
+        repeated = np.repeat(games, distances.size)
+        valid = self.fits(repeated, np.repeat(kind, distances.size), np.repeat(rotation, distances.size),
+                          (row[:, None] + distances).ravel(), np.repeat(column, distances.size))
+        dropped = (~valid.reshape(games.size, distances.size)).argmax(axis=1)
+        self.row[games] += dropped
+        self.place(games)
+        self.update_score(games, np.zeros(games.size, dtype=np.int64), dropped)
+
+    def hold_block(self, games):
+        games = games[~self.hold_swapped[games]]
+        kind = self.kind[games]
+        rotation = self.rotation[games]
+        held = self.hold[games]
+
+        empty = held == 0
+        first = games[empty]
+        self.set_current(first, self.pop_queue(first))
+
+        # Swapping back keeps the held rotation and drops the block in at row 0, column 3
+        swapped = games[~empty]
+        self.kind[swapped] = held[~empty]
+        self.rotation[swapped] = self.hold_rotation[swapped]
+        self.row[swapped] = 0
+        self.column[swapped] = 3 + self.spawn_shift
+
+        self.hold[games] = kind
+        self.hold_rotation[games] = rotation
+        self.hold_swapped[games] = True
+
+    def place(self, games):
+        valid = self.fits_current(games)
+        invalid = games[~valid]
+        self.rotation[invalid] = (self.rotation[invalid] + 1) % NUM_ROTATIONS[self.kind[invalid]]
+        games = games[valid]
+        if not games.size:
+            return
+
+        kind = self.kind[games]
+        cells = SHAPE_CELLS[kind, self.rotation[games]]
+        rows = cells[..., 0] + self.row[games][:, None]
+        columns = cells[..., 1] + self.column[games][:, None]
+        self.boards[games[:, None], rows, columns] = kind[:, None]
+
+        lines = self.clear_full_rows(games)
+        cleared = lines > 0
+        self.update_score(games[cleared], lines[cleared], np.zeros(cleared.sum(), dtype=np.int64))
+        self.previous_lines_cleared[games] = lines
+
+        self.set_current(games, self.pop_queue(games))
+        self.push_queue(games, self.draw_blocks(games))
+        self.hold_swapped[games] = False
+        self.game_over[games] |= ~self.fits_current(games)
+
+    def clear_full_rows(self, games):
+        # Row 0 is never cleared, same as Grid.clear_full_rows
+        full = (self.boards[games, 1:] != 0).all(axis=2)
+        lines = full.sum(axis=1)
+        cleared = lines > 0
+        if cleared.any():
+            games = games[cleared]
+            full = full[cleared]
+            # A stable sort moves the full rows above the kept ones without changing their order
+            order = np.argsort(~full, axis=1, kind="stable") + 1
+            rows = self.boards[games[:, None], order]
+            rows[np.arange(self.num_rows - 1)[None, :] < lines[cleared][:, None]] = 0
+            self.boards[games, 1:] = rows
+        return lines
+
+    def update_score(self, games, lines_cleared, rows_dropped_from):
+        previous = self.previous_lines_cleared[games]
+        line_clear_points = np.where(lines_cleared == 4, lines_cleared * 200, lines_cleared * 100)
+        back_to_back_tetris_points = np.where((lines_cleared == 4) & (previous == 4), line_clear_points, 0)
+        combo = (lines_cleared > 0) & (previous > 0)
+        combo_count = self.combo_count[games] + combo
+        combo_points = np.where(combo, combo_count * 50, 0)
+
+        self.score[games] += rows_dropped_from * 2 + line_clear_points + back_to_back_tetris_points + combo_points
+        self.previous_lines_cleared[games] = lines_cleared
+        self.combo_count[games] = np.where(lines_cleared == 0, 0, combo_count)
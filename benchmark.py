@@ -0,0 +1,350 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from actions import GRAVITY, HARD_DROP, HOLD, MOVE_LEFT, MOVE_RIGHT, ROTATE
+from bitboard import BitboardGrid
+from events import EventStream
+from features import FeatureGrid, batch_features, board_features, mask_boards
+from game import Game
+from placements import find_placements, game_placements
+import placements
+from utilities import CELL_SIZE
+
+# Canned boards, top row first. '#' is an occupied cell
+BOARDS = {
+    "empty": [".........."] * 20,
+    "mid_stack": [".........."] * 12 + [
+        "......#...",
+        "#....##..#",
+        "##..###.##",
+        "###.######",
+        "####.#####",
+        "#####.####",
+        "##.#######",
+        "#######.##",
+    ],
+    "near_top": [".........."] * 3 + [
+        "....#.....",
+        "#..###..#.",
+        "##.####.##",
+    ] + ["#.########", "########.#", "###.######", "######.###"] * 3 + [
+        "##.#######",
+        "#######.##",
+    ],
+    "tetris_ready": [".........."] * 12 + [
+        "#.........",
+        "##.....#..",
+        "###..####.",
+        "####.####.",
+        "#########.",
+        "#########.",
+        "#########.",
+        "#########.",
+    ],
+}
+# Board sizes (rows, columns) of the scaling benchmarks, the standard board and a large one
+SCALING_SIZES = ((20, 10), (100, 40))
+SEED = 1234
+DEFAULT_THRESHOLD = 0.2  # fraction a benchmark may get slower than the baseline before it counts as a regression
+
+
+def canned_game(board, grid=None):
+    game = Game(headless=True, seed=SEED, grid=grid)
+    game.grid.load_cells([[1 if cell == "#" else 0 for cell in row] for row in BOARDS[board]])
+    return game
+
+
+def stacked_game(num_rows, num_cols, cell_size=CELL_SIZE):
+    # Bottom half of the board filled, one hole per row, so nothing clears
+    game = Game(headless=True, seed=SEED, grid=BitboardGrid(num_rows, num_cols, cell_size))
+    cells = [[0] * num_cols for _ in range(num_rows - num_rows // 2)]
+    for row in range(num_rows // 2):
+        cells.append([0 if column == row * 7 % num_cols else 1 for column in range(num_cols)])
+    game.grid.load_cells(cells)
+    return game
+
+
+def placement_searches(games=10, turns=40):
+    # Searches a bot playing random placements makes in a few seeded games, as find_placements arguments. Every
+    # search is on the board the previous placement left behind
+    searches = []
+    for seed in range(games):
+        policy = random.Random(seed)
+        game = Game(headless=True, seed=seed)
+        for _ in range(turns):
+            if game.game_over:
+                break
+            block = game.current_block
+            search = (tuple(game.grid.rows), game.grid.full_row, block.id, block.rotation_state, block.row_offset,
+                      block.column_offset)
+            searches.append(search)
+            found = find_placements(*search)
+            if not found:
+                break
+            for action in policy.choice(found).actions:
+                game.apply_action(action)
+    return searches
+
+
+def measure(function, setup=None, iterations=1000, repeats=5):
+    # Best per call time in microseconds over a few repeats. With a setup the calls are timed one by one,
+    # so setup work is left out of the result
+    best = None
+    for _ in range(repeats):
+        if setup is None:
+            start = time.perf_counter_ns()
+            for _ in range(iterations):
+                function()
+            elapsed = time.perf_counter_ns() - start
+        else:
+            elapsed = 0
+            for _ in range(iterations):
+                setup()
+                start = time.perf_counter_ns()
+                function()
+                elapsed += time.perf_counter_ns() - start
+        per_call = elapsed / iterations / 1000
+        best = per_call if best is None else min(best, per_call)
+    return best
+
+
+def engine_benchmarks():
+    results = {}
+    for board in BOARDS:
+        game = canned_game(board)
+        results[f"is_valid_action[{board}]"] = measure(game.is_valid_action, iterations=20000)
+        results[f"get_cell_positions[{board}]"] = measure(game.current_block.get_cell_positions, iterations=20000)
+
+        start = game.snapshot()
+        results[f"hard_drop[{board}]"] = measure(game.hard_drop, lambda: game.restore(start), iterations=2000)
+        results[f"clear_full_rows[{board}]"] = measure(game.grid.clear_full_rows, lambda: game.restore(start),
+                                                       iterations=2000)
+
+        grid = game.grid
+        block = game.current_block
+
+        def search():
+            placements._cache.clear()
+            find_placements(grid.rows, grid.full_row, block.id, block.rotation_state, block.row_offset,
+                            block.column_offset)
+        results[f"find_placements[{board}]"] = measure(search, iterations=200)
+
+    # Real game boards one after another with the memo cleared, so no search gets anything from the one before
+    searches = placement_searches()
+
+    def search_games():
+        for search in searches:
+            placements._cache.clear()
+            find_placements(*search)
+    results["find_placements[games]"] = measure(search_games, iterations=1) / len(searches)
+
+    # Four full rows at the bottom, timing only the clear of a tetris
+    game = canned_game("tetris_ready")
+    tetris = [list(row) for row in game.grid.cells]
+    for row in tetris[-4:]:
+        row[-1] = 3
+    results["clear_full_rows[tetris]"] = measure(game.grid.clear_full_rows, lambda: game.grid.load_cells(tetris),
+                                                 iterations=2000)
+    return results
+
+
+def feature_benchmarks():
+    # Features of one board from its row masks, a hard drop on a FeatureGrid (set against hard_drop for the cost
+    # of keeping features up to date) and the features of all candidate boards of a move at once (needs NumPy)
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    results = {}
+    for board in BOARDS:
+        game = canned_game(board, FeatureGrid())
+        grid = game.grid
+        results[f"board_features[{board}]"] = measure(lambda: board_features(grid.rows, grid.full_row),
+                                                      iterations=5000)
+        start = game.snapshot()
+
+        def drop_and_update():
+            game.hard_drop()
+            grid.features()
+        results[f"feature_grid_hard_drop[{board}]"] = measure(drop_and_update, lambda: game.restore(start),
+                                                              iterations=2000)
+        if numpy is not None:
+            candidates = [placement.rows for placement in game_placements(game)[0]]
+            results[f"batch_features[{board}]"] = measure(
+                lambda: batch_features(mask_boards(candidates, grid.full_row)), iterations=200)
+    return results
+
+
+def game_benchmarks(games=20, max_actions=5000, stream=None):
+    # Whole headless games with a fixed seeded random policy, their events streamed when a stream is given
+    choices = (MOVE_LEFT, MOVE_RIGHT, ROTATE, GRAVITY, GRAVITY, HARD_DROP, HOLD)
+    actions = 0
+    start = time.perf_counter()
+    for seed in range(games):
+        policy = random.Random(seed)
+        game = Game(headless=True, seed=seed)
+        if stream is not None:
+            stream.attach(game, seed)
+        for _ in range(max_actions):
+            if game.game_over:
+                break
+            game.apply_action(policy.choice(choices))
+            actions += 1
+    elapsed = time.perf_counter() - start
+    return {"games_per_second": games / elapsed, "actions_per_second": actions / elapsed}
+
+
+def render_benchmarks():
+    # Frame times on an offscreen surface through SDL's dummy video driver, skipped without pygame
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        import pygame
+    except ImportError:
+        return {}
+    from renderer import IncrementalRenderer, PygameRenderer
+
+    pygame.display.init()
+    screen = pygame.Surface((600, 520))
+    results = {}
+    for board in ("empty", "near_top"):
+        game = canned_game(board)
+        full = PygameRenderer()
+        results[f"grid_draw[{board}]"] = measure(lambda: full.draw_grid(screen, game.grid), iterations=100)
+        results[f"game_draw[{board}]"] = measure(lambda: full.draw_game(screen, game), iterations=100)
+
+        incremental = IncrementalRenderer()
+        incremental.draw_game(screen, game)
+        results[f"incremental_idle_frame[{board}]"] = measure(lambda: incremental.draw_game(screen, game),
+                                                              iterations=1000)
+
+        def move_and_draw():
+            game.move_left() if game.current_block.column_offset > 1 else game.move_right()
+            incremental.draw_game(screen, game)
+        results[f"incremental_move_frame[{board}]"] = measure(move_and_draw, iterations=1000)
+    pygame.display.quit()
+    return results
+
+
+def scaling_benchmarks():
+    # Per tick costs on a standard and a large board. A gravity tick and the frame drawn after a move or a lock only
+    # touch the rows that changed, so they should stay about the same on the large board, while a full redraw,
+    # timed for contrast, grows with the number of cells
+    results = {}
+    for num_rows, num_cols in SCALING_SIZES:
+        size = f"{num_rows}x{num_cols}"
+        game = stacked_game(num_rows, num_cols)
+        start = game.snapshot()
+        results[f"gravity_tick[{size}]"] = measure(lambda: game.apply_action(GRAVITY), lambda: game.restore(start),
+                                                   iterations=2000)
+        tetris = [list(row) for row in game.grid.cells]
+        for row in tetris[-4:]:
+            row[:] = [3] * num_cols
+        results[f"clear_full_rows[tetris {size}]"] = measure(game.grid.clear_full_rows,
+                                                             lambda: game.grid.load_cells(tetris), iterations=2000)
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        import pygame
+    except ImportError:
+        return results
+    from renderer import IncrementalRenderer, Layout, PygameRenderer, fitting_cell_size
+
+    pygame.display.init()
+    for num_rows, num_cols in SCALING_SIZES:
+        size = f"{num_rows}x{num_cols}"
+        cell_size = fitting_cell_size(num_rows, num_cols)
+        layout = Layout(num_rows, num_cols, cell_size)
+        screen = pygame.Surface((layout.screen_width, layout.screen_height))
+        game = stacked_game(num_rows, num_cols, cell_size)
+        start = game.snapshot()
+        incremental = IncrementalRenderer(layout)
+        incremental.draw_game(screen, game)
+
+        def move_and_draw():
+            game.move_left() if game.current_block.column_offset > 1 else game.move_right()
+            incremental.draw_game(screen, game)
+        results[f"incremental_move_frame[{size}]"] = measure(move_and_draw, iterations=1000)
+
+        def reset_and_draw():
+            game.restore(start)
+            incremental.draw_game(screen, game)
+
+        def lock_and_draw():
+            game.hard_drop()
+            incremental.draw_game(screen, game)
+        results[f"incremental_lock_frame[{size}]"] = measure(lock_and_draw, reset_and_draw, iterations=500)
+
+        full = PygameRenderer(layout)
+        results[f"full_redraw[{size}]"] = measure(lambda: full.draw_game(screen, game), iterations=20)
+    pygame.display.quit()
+    return results
+
+
+def event_benchmarks():
+    # The same games with every event streamed as JSON to the null device, against games_per_second for the cost
+    # the simulation pays for being watched
+    with open(os.devnull, "wb") as output:
+        stream = EventStream(output)
+        games = game_benchmarks(stream=stream)
+        stream.close()
+    return {"streamed_games_per_second": games["games_per_second"]}
+
+
+def run():
+    results = {}
+    results.update(engine_benchmarks())
+    results.update(feature_benchmarks())
+    results.update(render_benchmarks())
+    results.update(scaling_benchmarks())
+    results.update(game_benchmarks())
+    results.update(event_benchmarks())
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Names of the benchmarks that got slower than the baseline by more than the threshold. Throughput results
+    # (per second) regress when they drop, everything else is a time and regresses when it grows
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        if name.endswith("_per_second"):
+            slower = value < baseline[name] * (1 - threshold)
+        else:
+            slower = value > baseline[name] * (1 + threshold)
+        if slower:
+            regressions.append(name)
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Benchmark the engine hot paths and rendering.")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results stored in this JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown against the baseline, as a fraction (default %(default)s)")
+    options = parser.parse_args(arguments)
+
+    results = run()
+    for name, value in results.items():
+        unit = "/s" if name.endswith("_per_second") else " us"
+        print(f"{name:45} {value:12.2f}{unit}")
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, options.threshold)
+        for name in regressions:
+            print(f"REGRESSION {name}: {results[name]:.2f} against baseline {baseline[name]:.2f}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
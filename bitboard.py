@@ -0,0 +1,89 @@
+from utilities import CELL_SIZE, GARBAGE, NUM_COLS, NUM_ROWS, SHAPES, Grid
+
+WALL = 4  # padding columns kept set on both sides of every row mask
+
+
+def _row_masks(cells):
+    rows = {}
+    for cell in cells:
+        rows[cell.row] = rows.get(cell.row, 0) | (1 << cell.column)
+    return tuple(sorted(rows.items()))
+
+
+# (row delta, row mask) pairs for every rotation of each block id
+PIECE_MASKS = {block_id: tuple(_row_masks(cells) for cells in rotations) for block_id, rotations in SHAPES.items()}
+
+
+class BitboardGrid(Grid):
+    # Grid that mirrors every row as an integer bitmask so collision and line checks are a few integer ops.
+    # Block ids are still kept in cells for drawing, but all writes have to go through place() and clear_full_rows()
+    def __init__(self, num_rows=NUM_ROWS, num_cols=NUM_COLS, cell_size=CELL_SIZE):
+        super().__init__(num_rows, num_cols, cell_size)
+        walls = (1 << WALL) - 1
+        self.full_row = (1 << (self.num_cols + 2 * WALL)) - 1
+        self.empty_row = walls | (walls << (self.num_cols + WALL))
+        self.rows = [self.empty_row] * self.num_rows
+
+    def is_empty_cell(self, row, column):
+        return not self.rows[row] >> (column + WALL) & 1
+
+    def fits(self, block):
+        return self.fits_at(block.id, block.rotation_state, block.row_offset, block.column_offset)
+
+    def fits_at(self, block_id, rotation, row, column):
+        shift = column + WALL
+        if shift < 0:
+            return False
+        rows = self.rows
+        for row_delta, mask in PIECE_MASKS[block_id][rotation]:
+            target = row + row_delta
+            if not 0 <= target < self.num_rows:
+                return False
+            mask <<= shift
+            if mask & rows[target] or mask > self.full_row:
+                return False
+        return True
+
+    def place(self, block):
+        super().place(block)
+        shift = block.column_offset + WALL
+        for row_delta, mask in PIECE_MASKS[block.id][block.rotation_state]:
+            self.rows[block.row_offset + row_delta] |= mask << shift
+
+    def clear_full_rows(self):
+        if self.full_row not in self.rows:
+            return 0
+        # Row 0 is never cleared or shifted, same as Grid.clear_full_rows
+        kept = [row for row in range(1, self.num_rows) if self.rows[row] != self.full_row]
+        rows_cleared = self.num_rows - 1 - len(kept)
+        if rows_cleared > 0:
+            self.rows[1:] = [self.empty_row] * rows_cleared + [self.rows[row] for row in kept]
+            self.cells[1:] = [[0] * self.num_cols for _ in range(rows_cleared)] + [self.cells[row] for row in kept]
+        return rows_cleared
+
+    def reset_grid(self):
+        super().reset_grid()
+        self.rows = [self.empty_row] * self.num_rows
+
+    def add_garbage(self, lines, hole_column):
+        lines = min(lines, self.num_rows)
+        overflow = any(row != self.empty_row for row in self.rows[:lines])
+        garbage = [GARBAGE] * self.num_cols
+        garbage[hole_column] = 0
+        self.cells = self.cells[lines:] + [garbage[:] for _ in range(lines)]
+        self.rows = self.rows[lines:] + [self.full_row & ~(1 << (hole_column + WALL))] * lines
+        return not overflow
+
+    def load_cells(self, cells):
+        super().load_cells(cells)
+        self.rows = [self.empty_row | sum(1 << (column + WALL) for column, cell in enumerate(row) if cell)
+                     for row in self.cells]
+
+    def snapshot(self):
+        # Row lists are never written to once shared, see place(), so a snapshot only copies the row references
+        return tuple(self.cells), tuple(self.rows)
+
+    def restore(self, snapshot):
+        cells, rows = snapshot
+        self.cells = list(cells)
+        self.rows = list(rows)
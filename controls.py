@@ -0,0 +1,107 @@
+import time
+from collections import deque, namedtuple
+from actions import MOVE_LEFT, MOVE_RIGHT, SOFT_DROP
+from timing import TICK_MS
+from utilities import NUM_COLS
+
+# Delayed auto shift: ms a left or right key is held before it starts repeating. Auto repeat rate: ms between
+# repeats after that, 0 moving the block as far as the board goes at once. Held soft drop repeats soft_drop_factor
+# times as fast as gravity
+Handling = namedtuple("Handling", ["das", "arr", "soft_drop_factor"])
+DEFAULT_HANDLING = Handling(das=167, arr=33, soft_drop_factor=20)
+
+# An action with the logic tick it was produced for, the perf_counter time in ms of the input behind it and whether
+# it repeats a held key
+TimedAction = namedtuple("TimedAction", ["tick", "time", "action", "repeat"])
+
+# How far each repeating action moves the block, as (rows, columns)
+REPEAT_SHIFTS = {MOVE_LEFT: (0, -1), MOVE_RIGHT: (0, 1), SOFT_DROP: (1, 0)}
+
+
+def repeats(held_ms, delay, interval, instant):
+    # Repeats due after a key has been held for held_ms, the first one delay ms after the press. instant stands in
+    # for an interval of 0
+    if held_ms < delay:
+        return 0
+    if interval <= 0:
+        return instant
+    return int((held_ms - delay) // interval) + 1
+
+
+class InputHandler:
+    # Turns keys into timestamped actions on a queue the scheduler feeds to the game. Presses come from KEYDOWN
+    # events and are queued straight away, so even a tap shorter than a tick counts and is applied the same frame.
+    # Key state is polled once per logic tick to see which keys are still held and to queue their repeats: left and
+    # right after DAS every ARR, the most recently pressed of the two winning while both are held, and soft drop at
+    # the gravity speed divided by the soft drop factor
+    def __init__(self, bindings, key_state, handling=DEFAULT_HANDLING, tick_ms=TICK_MS, num_cols=NUM_COLS):
+        self.bindings = bindings  # key -> action
+        self.key_state = key_state  # returns something indexed by key that is true for held keys
+        self.handling = handling
+        self.tick_ms = tick_ms
+        self.num_cols = num_cols  # moves an ARR of 0 makes, enough to cross the board
+        self.queue = deque()
+        self.reset()
+
+    def reset(self):
+        # Forgets queued actions and held keys, a key still down only repeats again once it is pressed again
+        self.queue.clear()
+        self.tick = 0
+        self.shifts = []  # left and right as long as they are held, the last pressed one at the end
+        self.shift_ms = 0.0
+        self.drop_ms = None  # ms soft drop has been held for, None while it is not
+
+    def press(self, key):
+        action = self.bindings.get(key)
+        if action is None:
+            return False
+        self.queue.append(TimedAction(self.tick, time.perf_counter() * 1000, action, False))
+        if action == MOVE_LEFT or action == MOVE_RIGHT:
+            if action in self.shifts:
+                self.shifts.remove(action)
+            self.shifts.append(action)
+            self.shift_ms = 0.0
+        elif action == SOFT_DROP:
+            self.drop_ms = 0.0
+        return True
+
+    def poll(self, tick, gravity_ms):
+        # Queues the repeats of held keys for a logic tick, gravity_ms being the current gravity interval
+        self.tick = tick
+        state = self.key_state()
+        held = {action for key, action in self.bindings.items() if state[key]}
+        now = time.perf_counter() * 1000
+
+        shift = self.shifts[-1] if self.shifts else None
+        self.shifts = [action for action in self.shifts if action in held]
+        if self.shifts:
+            if self.shifts[-1] != shift:
+                # Letting go of the latest direction hands over to the other one, which starts its delay afresh
+                self.shift_ms = 0.0
+            else:
+                das, arr = self.handling.das, self.handling.arr
+                before = repeats(self.shift_ms, das, arr, self.num_cols)
+                self.shift_ms += self.tick_ms
+                due = min(repeats(self.shift_ms, das, arr, self.num_cols) - before, self.num_cols)
+                for _ in range(due):
+                    self.queue.append(TimedAction(tick, now, self.shifts[-1], True))
+
+        if self.drop_ms is not None:
+            if SOFT_DROP not in held:
+                self.drop_ms = None
+            else:
+                interval = gravity_ms / self.handling.soft_drop_factor
+                before = repeats(self.drop_ms, interval, interval, 1)
+                self.drop_ms += self.tick_ms
+                for _ in range(repeats(self.drop_ms, interval, interval, 1) - before):
+                    self.queue.append(TimedAction(tick, now, SOFT_DROP, True))
+
+    def feed(self, game, apply):
+        # Hands the queued actions to apply in order. Repeats only go through while they still move the block, so a
+        # block held against a wall or the floor is left to the lock delay and no-op repeats stay out of replays
+        while self.queue and not game.game_over:
+            timed = self.queue.popleft()
+            if timed.repeat and not game.can_shift(*REPEAT_SHIFTS[timed.action]):
+                continue
+            apply(timed.action)
+        self.queue.clear()
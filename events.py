@@ -0,0 +1,202 @@
+import json
+import socket
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+
+CAPACITY = 4096  # events a stream buffers before it drops the oldest
+FLUSH_MS = 20  # how long the stream writer sleeps when there is nothing to write
+SEND_TIMEOUT = 2.0  # seconds a socket write may block before the stream gives up on the reader
+CLOSE_TIMEOUT = 1.0  # seconds close waits for buffered events to be written
+FORMATS = ("json", "binary")
+
+# Binary frames: field count, event kind, game id and time, then every field of the event as a signed 64 bit int
+FRAME_HEADER = struct.Struct("<BBId")
+FIELD = struct.Struct("<q")
+
+
+class PieceSpawned(namedtuple("PieceSpawned", ["block_id", "row", "column"])):
+    __slots__ = ()
+    KIND = 1
+    NAME = "piece_spawned"
+
+
+class PieceLocked(namedtuple("PieceLocked", ["block_id", "rotation", "row", "column", "pieces"])):
+    __slots__ = ()
+    KIND = 2
+    NAME = "piece_locked"
+
+
+class LinesCleared(namedtuple("LinesCleared", ["lines", "total"])):
+    __slots__ = ()
+    KIND = 3
+    NAME = "lines_cleared"
+
+
+class Combo(namedtuple("Combo", ["count"])):
+    __slots__ = ()
+    KIND = 4
+    NAME = "combo"
+
+
+class ScoreChanged(namedtuple("ScoreChanged", ["points", "score"])):
+    __slots__ = ()
+    KIND = 5
+    NAME = "score_changed"
+
+
+class PieceHeld(namedtuple("PieceHeld", ["block_id"])):
+    __slots__ = ()
+    KIND = 6
+    NAME = "piece_held"
+
+
+class GameOver(namedtuple("GameOver", ["score", "lines", "pieces"])):
+    __slots__ = ()
+    KIND = 7
+    NAME = "game_over"
+
+
+class GameReset(namedtuple("GameReset", ["seed"])):
+    __slots__ = ()
+    KIND = 8
+    NAME = "game_reset"
+
+
+EVENT_TYPES = {event_type.KIND: event_type for event_type in (PieceSpawned, PieceLocked, LinesCleared, Combo,
+                                                               ScoreChanged, PieceHeld, GameOver, GameReset)}
+EVENT_NAMES = {event_type.NAME: event_type for event_type in EVENT_TYPES.values()}
+
+
+class EventBus:
+    # Calls every subscriber with each event a game emits, in the order they subscribed. A bus is false while
+    # nobody listens, and games only build an event when it is true, so an unwatched game pays one test per event
+    def __init__(self):
+        self.subscribers = []
+
+    def __bool__(self):
+        return bool(self.subscribers)
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def emit(self, event):
+        for callback in self.subscribers:
+            callback(event)
+
+
+def encode_json(game_id, timestamp, event):
+    record = {"game": game_id, "time": timestamp, "event": event.NAME}
+    record.update(zip(event._fields, event))
+    return json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+
+def encode_binary(game_id, timestamp, event):
+    return FRAME_HEADER.pack(len(event), event.KIND, game_id, timestamp) + b"".join(FIELD.pack(value)
+                                                                                     for value in event)
+
+
+def read_events(stream, format="json"):
+    # Yields (game id, time, event) from a stream written by an EventStream
+    if format == "json":
+        for line in stream:
+            record = json.loads(line)
+            event_type = EVENT_NAMES[record["event"]]
+            yield record["game"], record["time"], event_type(*(record[field] for field in event_type._fields))
+        return
+    while True:
+        header = stream.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        count, kind, game_id, timestamp = FRAME_HEADER.unpack(header)
+        fields = stream.read(count * FIELD.size)
+        yield game_id, timestamp, EVENT_TYPES[kind](*struct.unpack(f"<{count}q", fields))
+
+
+def open_target(target):
+    # A binary file object for a "HOST:PORT" socket address or a file path, appended to
+    host, _, port = target.rpartition(":")
+    if host and port.isdigit():
+        return socket.create_connection((host, int(port)), timeout=SEND_TIMEOUT).makefile("wb")
+    return open(target, "ab")
+
+
+class EventStream:
+    # Streams the events of any number of games to a file object such as a file or a socket. Subscribing callbacks
+    # only append to a bounded buffer, a background thread encodes and writes, so a slow or stuck reader never holds
+    # up a game. When the reader falls more than capacity events behind, the oldest are dropped and counted in
+    # dropped. A stream that failed to write keeps dropping everything it is given, counted in lost. Each counter
+    # is only changed by one thread, dropped by the one the games run on and lost by the writer
+    def __init__(self, output, format="json", capacity=CAPACITY):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown event stream format: {format}")
+        self.output = output
+        self.encode = encode_json if format == "json" else encode_binary
+        self.buffer = deque(maxlen=capacity)
+        self.dropped = 0
+        self.lost = 0
+        self.written = 0
+        self.failed = False
+        self.closing = False
+        self.wakeup = threading.Event()
+        self.writer = threading.Thread(target=self.write_loop, name="event-stream", daemon=True)
+        self.writer.start()
+
+    def attach(self, game, game_id=0):
+        # Subscribes to a game's events under game_id, returns the callback for unsubscribing
+        buffer = self.buffer
+
+        def queue_event(event):
+            if len(buffer) == buffer.maxlen:
+                self.dropped += 1
+            buffer.append((game_id, time.time(), event))
+        return game.events.subscribe(queue_event)
+
+    def write_loop(self):
+        buffer = self.buffer
+        while True:
+            chunks = []
+            while buffer:
+                try:
+                    queued = buffer.popleft()
+                except IndexError:  # emptied by a close that gave up waiting
+                    break
+                chunks.append(self.encode(*queued))
+            if chunks and not self.failed:
+                try:
+                    self.output.write(b"".join(chunks))
+                    self.output.flush()
+                    self.written += len(chunks)
+                except (OSError, ValueError):
+                    self.failed = True
+            if self.failed:
+                self.lost += len(chunks)
+            if self.closing and not buffer:
+                return
+            self.wakeup.wait(FLUSH_MS / 1000)
+            self.wakeup.clear()
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        # Writes everything still buffered, then closes the output. A writer still stuck on the reader after timeout
+        # seconds is left behind: what it has not taken from the buffer yet is dropped and the output stays open,
+        # since closing it would wait on the write in progress
+        self.closing = True
+        self.wakeup.set()
+        self.writer.join(timeout)
+        if self.writer.is_alive():
+            while self.buffer:
+                try:
+                    self.buffer.popleft()
+                except IndexError:
+                    break
+                self.dropped += 1
+            return
+        try:
+            self.output.close()
+        except OSError:
+            pass
@@ -0,0 +1,185 @@
+from collections import namedtuple
+from itertools import chain
+from bitboard import PIECE_MASKS, WALL, BitboardGrid
+from utilities import CELL_SIZE, NUM_COLS, NUM_ROWS
+
+# Board features for heuristic bots:
+#   heights          per column, rows from the floor up to and including the top filled cell, 0 when empty
+#   aggregate_height sum of heights
+#   holes            empty cells with a filled cell somewhere above them in their column
+#   bumpiness        sum of height differences between neighbouring columns
+#   row_transitions  filled/empty changes along every row holding a block, the walls counting as filled
+#   wells            per column, how far it lies below the lower of its neighbours, the walls being as high as the
+#                    board
+# The same namedtuple holds NumPy arrays with one entry (or row) per board when it comes from batch_features
+BoardFeatures = namedtuple("BoardFeatures", ["heights", "aggregate_height", "holes", "bumpiness", "row_transitions",
+                                             "wells"])
+
+
+def _popcount(value):
+    return bin(value).count("1")
+
+
+# int.bit_count is only there from Python 3.10 on
+popcount = getattr(int, "bit_count", _popcount)
+
+
+def _summarize(heights, holes, row_transitions, num_rows):
+    heights = tuple(heights)
+    bumpiness = 0
+    for left, right in zip(heights, heights[1:]):
+        bumpiness += left - right if left > right else right - left
+    wells = []
+    for left, height, right in zip((num_rows,) + heights, heights, heights[1:] + (num_rows,)):
+        side = left if left < right else right
+        wells.append(side - height if side > height else 0)
+    return BoardFeatures(heights, sum(heights), holes, bumpiness, row_transitions, tuple(wells))
+
+
+def _transition_window(num_cols):
+    # Bits of (mask ^ mask >> 1) comparing each pair of neighbouring cells of a row, one wall on each side included
+    return ((1 << (num_cols + 1)) - 1) << (WALL - 1)
+
+
+def board_features(rows, full_row):
+    # Features of a board given as BitboardGrid row masks, such as Placement.rows, in one pass from the top.
+    # Every filled cell lies at or below the top of its column, so the holes are the cells under the tops
+    # (the aggregate height) less the filled ones
+    num_rows = len(rows)
+    num_cols = full_row.bit_length() - 2 * WALL
+    inside = ((1 << num_cols) - 1) << WALL
+    empty_row = full_row & ~inside
+    window = _transition_window(num_cols)
+    heights = [0] * num_cols
+    filled = 0
+    row_transitions = 0
+    covered = 0
+    for index, mask in enumerate(rows):
+        if mask == empty_row:
+            continue
+        row_transitions += popcount((mask ^ mask >> 1) & window)
+        filled += popcount(mask) - 2 * WALL
+        new = mask & inside & ~covered
+        if new:
+            covered |= new
+            while new:
+                bit = new & -new
+                heights[bit.bit_length() - 1 - WALL] = num_rows - index
+                new ^= bit
+    return _summarize(heights, sum(heights) - filled, row_transitions, num_rows)
+
+
+class FeatureGrid(BitboardGrid):
+    # BitboardGrid that keeps the board features up to date as blocks are placed and rows cleared. Every column is
+    # mirrored as a bitmask of its filled rows (bit 0 the top row), so a placement only recounts the height and
+    # holes of the columns and the transitions of the rows the block touched
+    def __init__(self, num_rows=NUM_ROWS, num_cols=NUM_COLS, cell_size=CELL_SIZE):
+        super().__init__(num_rows, num_cols, cell_size)
+        self.transition_window = _transition_window(self.num_cols)
+        self.rebuild_features()
+
+    def rebuild_features(self):
+        self.column_masks = [sum(1 << row for row in range(self.num_rows) if self.rows[row] >> (column + WALL) & 1)
+                             for column in range(self.num_cols)]
+        self.column_heights = [0] * self.num_cols
+        self.column_holes = [0] * self.num_cols
+        for column in range(self.num_cols):
+            self.update_column(column)
+        self.row_transitions = [self.count_transitions(mask) for mask in self.rows]
+        self.cached_features = None
+
+    def update_column(self, column):
+        mask = self.column_masks[column]
+        height = self.num_rows - ((mask & -mask).bit_length() - 1) if mask else 0
+        self.column_heights[column] = height
+        self.column_holes[column] = height - popcount(mask)
+
+    def count_transitions(self, mask):
+        if mask == self.empty_row:
+            return 0
+        return popcount((mask ^ mask >> 1) & self.transition_window)
+
+    def features(self):
+        if self.cached_features is None:
+            self.cached_features = _summarize(self.column_heights, sum(self.column_holes), sum(self.row_transitions),
+                                              self.num_rows)
+        return self.cached_features
+
+    def place(self, block):
+        super().place(block)
+        columns = set()
+        for position in block.get_cell_positions():
+            self.column_masks[position.column] |= 1 << position.row
+            columns.add(position.column)
+        for column in columns:
+            self.update_column(column)
+        for row_delta, _ in PIECE_MASKS[block.id][block.rotation_state]:
+            row = block.row_offset + row_delta
+            self.row_transitions[row] = self.count_transitions(self.rows[row])
+        self.cached_features = None
+
+    def clear_full_rows(self):
+        cleared = [row for row in range(1, self.num_rows) if self.rows[row] == self.full_row]
+        rows_cleared = super().clear_full_rows()
+        if rows_cleared > 0:
+            # Drop the cleared bits out of every column, top one first: the rows between row 0 and a cleared row
+            # move down by one and row 0 stays where it is, as in clear_full_rows
+            for column in range(self.num_cols):
+                mask = self.column_masks[column]
+                for row in cleared:
+                    mask = mask & 1 | (mask & ((1 << row) - 2)) << 1 | mask & ~((1 << (row + 1)) - 1)
+                self.column_masks[column] = mask
+                self.update_column(column)
+            transitions = [self.row_transitions[row] for row in range(1, self.num_rows) if row not in cleared]
+            self.row_transitions[1:] = [0] * rows_cleared + transitions
+            self.cached_features = None
+        return rows_cleared
+
+    def reset_grid(self):
+        super().reset_grid()
+        self.rebuild_features()
+
+    def add_garbage(self, lines, hole_column):
+        fitted = super().add_garbage(lines, hole_column)
+        self.rebuild_features()
+        return fitted
+
+    def load_cells(self, cells):
+        super().load_cells(cells)
+        self.rebuild_features()
+
+    def restore(self, snapshot):
+        super().restore(snapshot)
+        self.rebuild_features()
+
+
+def mask_boards(boards, full_row):
+    # Boards of BitboardGrid row masks, such as the rows of a list of placements, as one array of cells
+    # [board, row, column] for batch_features
+    import numpy as np
+    num_cols = full_row.bit_length() - 2 * WALL
+    boards = list(boards)
+    num_rows = len(boards[0]) if boards else 0
+    masks = np.fromiter(chain.from_iterable(boards), dtype=np.int64, count=len(boards) * num_rows)
+    return masks.reshape(len(boards), num_rows, 1) >> np.arange(WALL, WALL + num_cols) & 1
+
+
+def batch_features(boards):
+    # Features of many boards at once from an array of cells [board, row, column], nonzero cells being filled.
+    # Takes BatchEnv.boards as it is. Every field is an array with one entry per board, heights and wells one
+    # row per board
+    import numpy as np
+    filled = np.asarray(boards) != 0
+    num_boards, num_rows, num_cols = filled.shape
+    covered = np.logical_or.accumulate(filled, axis=1)
+    heights = covered.sum(axis=1)
+    holes = (covered & ~filled).sum(axis=(1, 2))
+    bumpiness = np.abs(np.diff(heights, axis=1)).sum(axis=1)
+    walled = np.ones((num_boards, num_rows, num_cols + 2), dtype=bool)
+    walled[:, :, 1:-1] = filled
+    changes = (walled[:, :, 1:] != walled[:, :, :-1]).sum(axis=2)
+    row_transitions = np.where(filled.any(axis=2), changes, 0).sum(axis=1)
+    sides = np.full((num_boards, num_cols + 2), num_rows)
+    sides[:, 1:-1] = heights
+    wells = np.maximum(np.minimum(sides[:, :-2], sides[:, 2:]) - heights, 0)
+    return BoardFeatures(heights, heights.sum(axis=1), holes, bumpiness, row_transitions, wells)
@@ -1,37 +1,96 @@
+import copy
 import random
-from collections import deque
+from collections import deque, namedtuple
+from actions import GRAVITY, HARD_DROP, HOLD, MOVE_LEFT, MOVE_RIGHT, NONE, ROTATE, ROTATE_180, ROTATE_CCW, SOFT_DROP
+from bitboard import BitboardGrid
+from events import (Combo, EventBus, GameOver, GameReset, LinesCleared, PieceHeld, PieceLocked, PieceSpawned,
+                    ScoreChanged)
+from rotation import kick
+from sinks import NullRenderer, NullSounds
 from utilities import *
 
+GameSnapshot = namedtuple("GameSnapshot", ["grid", "current_block", "hold", "next_blocks", "blocks", "random_state",
+                                           "seed", "hold_swapped_this_drop", "game_over", "score", "lines_cleared",
+                                           "pieces_placed", "previous_lines_cleared", "combo_count", "garbage_in",
+                                           "garbage_out", "tetrises", "max_combo"])
+
+# Garbage lines sent to the opponent by clearing 0, 1, 2, 3 or 4 lines at once
+GARBAGE_LINES = (0, 0, 1, 2, 4)
+
+
 class Game:
-    def __init__(self):
-        self.grid = Grid()
+    def __init__(self, headless=False, sounds=None, renderer=None, grid=None, seed=None):
+        # Every game owns its piece generator, so the same seed always deals the same pieces
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.random = random.Random(self.seed)
+        self.random_state = None  # last known state of self.random, kept until the next block is drawn
+        self.grid = grid if grid is not None else BitboardGrid()
+        self.spawn_shift = spawn_shift(self.grid.num_cols)
+        self.events = EventBus()  # spawns, locks, line clears, combos, score changes, holds and game over
         self.blocks = [IBlock(), JBlock(), LBlock(), OBlock(), SBlock(), TBlock(), ZBlock()]
-        self.current_block = self.get_random_block()
+        self.current_block = self.spawn(self.get_random_block())
         self.next_blocks = deque([self.get_random_block() for _ in range(5)])
         self.hold = None
         self.pause = False
         self.game_over = False
         self.hold_swapped_this_drop = False
         self.score = 0
+        self.lines_cleared = 0
+        self.pieces_placed = 0
         self.previous_lines_cleared = 0
         self.combo_count = 0
-        self.rotate_sound = pygame.mixer.Sound("resources/rotate.wav")
-        self.clear_sound = pygame.mixer.Sound("resources/clear.wav")
+        self.garbage_in = 0  # lines received from the opponent, added under the stack with the next locked block
+        self.garbage_out = 0  # lines sent by own line clears, taken away by whoever relays them
+        self.tetrises = 0
+        self.max_combo = 0
+
+        # Headless games never touch pygame, the default sinks are only imported when drawing to a screen
+        if sounds is None:
+            if headless:
+                sounds = NullSounds()
+            else:
+                from sounds import PygameSounds
+                sounds = PygameSounds()
+        if renderer is None:
+            if headless:
+                renderer = NullRenderer()
+            else:
+                from renderer import Layout, PygameRenderer
+                renderer = PygameRenderer(Layout(self.grid.num_rows, self.grid.num_cols, self.grid.cell_size))
+        self.sounds = sounds
+        self.renderer = renderer
 
     def is_valid_action(self):
         # Validate that the action stays inside the grid and does not collide with other pieces
-        for cell in self.current_block.get_cell_positions():
-            if not self.grid.is_inside(cell.row, cell.column) or not self.grid.is_empty_cell(cell.row, cell.column):
-                return False
-        return True
+        return self.grid.fits(self.current_block)
+
+    def is_grounded(self):
+        # Whether the current block rests on the stack or the floor
+        return not self.can_shift(1, 0)
+
+    def can_shift(self, rows, columns):
+        # Whether the current block could move by rows and columns, the block is left where it is
+        self.current_block.move(rows, columns)
+        fits = self.is_valid_action()
+        self.current_block.move(-rows, -columns)
+        return fits
 
     def get_random_block(self):
         if len(self.blocks) == 0:
             self.blocks = [IBlock(), JBlock(), LBlock(), OBlock(), SBlock(), TBlock(), ZBlock()]
-        block = random.choice(self.blocks)
+        block = self.random.choice(self.blocks)
+        self.random_state = None
         self.blocks.remove(block)
         return block
 
+    def spawn(self, block):
+        # Blocks are built at their spawn on a standard width board and the queue keeps them there for drawing,
+        # a block coming into play is moved to the middle of this board
+        block.move(0, self.spawn_shift)
+        if self.events:
+            self.events.emit(PieceSpawned(block.id, block.row_offset, block.column_offset))
+        return block
+
     def soft_drop(self):
         self.current_block.move(1, 0)
         if not self.is_valid_action():
@@ -52,13 +111,21 @@ class Game:
     def hold_block(self):
         if self.hold is None and not self.hold_swapped_this_drop:
             self.hold = self.current_block
-            self.current_block = self.next_blocks.popleft()
+            self.hold.reset_hold_block()
+            if self.events:
+                self.events.emit(PieceHeld(self.hold.id))
+            self.current_block = self.spawn(self.next_blocks.popleft())
             self.hold_swapped_this_drop = True
 
         elif not self.hold_swapped_this_drop:
             self.hold, self.current_block = self.current_block, self.hold
-            self.current_block.move(0, 3)
+            self.hold.reset_hold_block()
+            self.current_block.move(0, 3 + self.spawn_shift)
             self.hold_swapped_this_drop = True
+            if self.events:
+                block = self.current_block
+                self.events.emit(PieceHeld(self.hold.id))
+                self.events.emit(PieceSpawned(block.id, block.row_offset, block.column_offset))
 
     def move_left(self):
         self.current_block.move(0, -1)
@@ -72,64 +139,154 @@ class Game:
 
     def place_block(self):
         if self.is_valid_action():
-            current_block_cells = self.current_block.get_cell_positions()
-            for position in current_block_cells:
-                self.grid.cells[position.row][position.column] = self.current_block.id
+            self.grid.place(self.current_block)
 
             rows_cleared = self.grid.clear_full_rows()
+            self.lines_cleared += rows_cleared
+            self.pieces_placed += 1
+            if self.events:
+                block = self.current_block
+                self.events.emit(PieceLocked(block.id, block.rotation_state, block.row_offset, block.column_offset,
+                                             self.pieces_placed))
+                if rows_cleared > 0:
+                    self.events.emit(LinesCleared(rows_cleared, self.lines_cleared))
+            if rows_cleared == 4:
+                self.tetrises += 1
             if rows_cleared > 0:
-                self.clear_sound.play()
+                self.sounds.play("clear")
                 self.update_score(rows_cleared, 0)
             self.previous_lines_cleared = rows_cleared
+            # Incoming garbage rises when a block locks without clearing anything
+            if rows_cleared == 0 and self.garbage_in:
+                if not self.grid.add_garbage(self.garbage_in, self.garbage_hole()):
+                    self.game_over = True
+                self.garbage_in = 0
 
-            self.current_block = self.next_blocks.popleft()
+            self.current_block = self.spawn(self.next_blocks.popleft())
             self.next_blocks.append(self.get_random_block())
             self.hold_swapped_this_drop = False
 
             # Game is over when a block collides with an occupied cell
-            for cell in self.current_block.get_cell_positions():
-                if not self.grid.is_empty_cell(cell.row, cell.column):
-                    self.game_over = True
+            if not self.is_valid_action():
+                self.game_over = True
         else:
             self.current_block.rotate()
 
-    def reset(self):
+    def reset(self, seed=None):
+        # A reset deals a fresh bag and queue from the new seed so the next game can be replayed on its own
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.random = random.Random(self.seed)
+        self.random_state = None
+        if self.events:
+            self.events.emit(GameReset(self.seed))
         self.grid.reset_grid()
-        self.next_blocks.append(self.get_random_block())
-        self.current_block = self.next_blocks.popleft()
+        self.blocks = [IBlock(), JBlock(), LBlock(), OBlock(), SBlock(), TBlock(), ZBlock()]
+        self.current_block = self.spawn(self.get_random_block())
+        self.next_blocks = deque([self.get_random_block() for _ in range(5)])
         self.hold = None
+        self.game_over = False
+        self.hold_swapped_this_drop = False
         self.score = 0
+        self.lines_cleared = 0
+        self.pieces_placed = 0
+        self.previous_lines_cleared = 0
+        self.combo_count = 0
+        self.garbage_in = 0
+        self.garbage_out = 0
+        self.tetrises = 0
+        self.max_combo = 0
 
-    def rotate(self):
-        self.current_block.rotate()
-        if not self.is_valid_action():
-            self.try_kicking()
-            self.current_block.undo_rotation()
-        self.rotate_sound.play()
+    def receive_garbage(self, lines):
+        self.garbage_in += lines
 
-    def try_kicking(self):
-        block_width = 4 if isinstance(self.current_block, IBlock) else 3
+    def garbage_hole(self):
+        # Worked out from the seed and piece count only, so every peer simulating this game picks the same column
+        return random.Random(self.seed * 1000003 + self.pieces_placed).randrange(self.grid.num_cols)
 
-        if self.current_block.column_offset < 0:  # if colliding with left wall
-            self.current_block.move(0, 2 if isinstance(self.current_block, IBlock) else 1)
-            self.current_block.rotate()
-            if not self.is_valid_action():
-                self.current_block.move(0, -2 if isinstance(self.current_block, IBlock) else -1)
-                self.current_block.undo_rotation()
-
-        elif self.current_block.column_offset + block_width >= self.grid.num_cols:  # right wall
-            if isinstance(self.current_block, IBlock):
-                self.current_block.move(0, -2)
-                self.current_block.rotate()
-                if not self.is_valid_action():
-                    self.current_block.move(0, 2)
-                    self.current_block.undo_rotation()
-            else:
-                self.current_block.move(0, -1)
-                self.current_block.rotate()
-                if not self.is_valid_action():
-                    self.current_block.move(0, 1)
-                    self.current_block.undo_rotation()
+    def snapshot(self):
+        # Everything in a snapshot is immutable and shared where possible: grid rows, block states as tuples and
+        # the queue and bag as tuples of block ids. The generator state is only fetched again after a block was
+        # drawn, so snapshots taken between draws share it too
+        if self.random_state is None:
+            self.random_state = self.random.getstate()
+        return GameSnapshot(self.grid.snapshot(), self.current_block.state(),
+                            self.hold.state() if self.hold is not None else None,
+                            tuple(block.id for block in self.next_blocks), tuple(block.id for block in self.blocks),
+                            self.random_state, self.seed, self.hold_swapped_this_drop, self.game_over,
+                            self.score, self.lines_cleared, self.pieces_placed, self.previous_lines_cleared,
+                            self.combo_count, self.garbage_in, self.garbage_out, self.tetrises, self.max_combo)
+
+    def restore(self, snapshot):
+        self.grid.restore(snapshot.grid)
+        self.current_block = block_from_state(snapshot.current_block)
+        self.hold = block_from_state(snapshot.hold) if snapshot.hold is not None else None
+        # Queued and bagged blocks are never moved before they are dealt, so unchanged ones are kept as they are
+        if tuple(block.id for block in self.next_blocks) != snapshot.next_blocks:
+            self.next_blocks = deque(BLOCK_TYPES[block_id]() for block_id in snapshot.next_blocks)
+        if tuple(block.id for block in self.blocks) != snapshot.blocks:
+            self.blocks = [BLOCK_TYPES[block_id]() for block_id in snapshot.blocks]
+        if snapshot.random_state is not self.random_state:
+            self.random.setstate(snapshot.random_state)
+            self.random_state = snapshot.random_state
+        self.seed = snapshot.seed
+        self.hold_swapped_this_drop = snapshot.hold_swapped_this_drop
+        self.game_over = snapshot.game_over
+        self.score = snapshot.score
+        self.lines_cleared = snapshot.lines_cleared
+        self.pieces_placed = snapshot.pieces_placed
+        self.previous_lines_cleared = snapshot.previous_lines_cleared
+        self.combo_count = snapshot.combo_count
+        self.garbage_in = snapshot.garbage_in
+        self.garbage_out = snapshot.garbage_out
+        self.tetrises = snapshot.tetrises
+        self.max_combo = snapshot.max_combo
+
+    def clone(self):
+        # Independent copy sharing the sound and draw sinks. Its events go to a bus of its own, so trying moves out
+        # on a clone is not seen by whoever watches this game
+        game = copy.copy(self)
+        game.events = EventBus()
+        game.grid = self.grid.copy()
+        game.random = random.Random(0)
+        game.random_state = None
+        game.next_blocks = deque()
+        game.blocks = []
+        game.restore(self.snapshot())
+        return game
+
+    def apply_action(self, action):
+        was_over = self.game_over
+        if action == MOVE_LEFT:
+            self.move_left()
+        elif action == MOVE_RIGHT:
+            self.move_right()
+        elif action == ROTATE:
+            self.rotate()
+        elif action == ROTATE_CCW:
+            self.rotate(3)
+        elif action == ROTATE_180:
+            self.rotate(2)
+        elif action == SOFT_DROP or action == GRAVITY:
+            self.soft_drop()
+        elif action == HARD_DROP:
+            row_dropped_from = self.hard_drop()
+            self.update_score(0, row_dropped_from)
+        elif action == HOLD:
+            self.hold_block()
+        elif action != NONE:
+            raise ValueError(f"Unknown action: {action}")
+        # Only once the action is done, a hard drop scores its drop after the block has locked
+        if self.game_over and not was_over and self.events:
+            self.events.emit(GameOver(self.score, self.lines_cleared, self.pieces_placed))
+
+    def rotate(self, turns=1):
+        # Turns clockwise (1), half way round (2) or counter clockwise (3), taking the first SRS kick that fits
+        block = self.current_block
+        rotated = kick(self.grid.fits_at, block.id, block.rotation_state, block.row_offset, block.column_offset,
+                       turns)
+        if rotated is not None:
+            block.rotation_state, block.row_offset, block.column_offset = rotated
+        self.sounds.play("rotate")
 
     def update_score(self, lines_cleared, rows_dropped_from):
         hard_drop_points = rows_dropped_from * 2  # Hard drop = 2 point per block below drop point
@@ -148,49 +305,24 @@ class Game:
         combo_points = 0
         if lines_cleared > 0 and self.previous_lines_cleared > 0:
             self.combo_count += 1
+            self.max_combo = max(self.max_combo, self.combo_count)
             combo_points = self.combo_count * 50
+            if self.events:
+                self.events.emit(Combo(self.combo_count))
+
+        # Line clears first cancel incoming garbage, what is left over is sent on
+        attack = GARBAGE_LINES[min(lines_cleared, 4)]
+        cancelled = min(attack, self.garbage_in)
+        self.garbage_in -= cancelled
+        self.garbage_out += attack - cancelled
 
         total_points = hard_drop_points + line_clear_points + back_to_back_tetris_points + combo_points
         self.score += total_points
+        if total_points and self.events:
+            self.events.emit(ScoreChanged(total_points, self.score))
         self.previous_lines_cleared = lines_cleared if lines_cleared > 0 else 0
         self.combo_count = 0 if lines_cleared == 0 else self.combo_count
 
-    def draw(self, screen, paused=False, game_over=False):
-        # Draw the grid
-        self.grid.draw(screen, paused=paused, game_over=game_over)
-        for row in range(self.grid.num_rows):
-            for col in range(self.grid.num_cols):
-                if self.grid.cells[row][col] != 0:
-                    cell_rect = pygame.Rect(col * self.grid.cell_size + 190, row * self.grid.cell_size + 11,
-                                            self.grid.cell_size - 4, self.grid.cell_size - 4)
-                    if paused or game_over:
-                        pygame.draw.rect(screen, Colors.get_grays()[self.grid.cells[row][col]], cell_rect, 3)
-                    else:
-                        pygame.draw.rect(screen, Colors.get_colors()[self.grid.cells[row][col]], cell_rect, 3)
-
-        # Draw the current block
-        self.current_block.draw(screen, 190, 11, paused=paused, game_over=game_over)
-
-        # Draw hold block
-        if self.hold is not None:
-            if paused or game_over:
-                self.hold.reset_hold_block()
-                self.hold.draw(screen, 60, 130, paused=True, game_over=game_over)
-            else:
-                self.hold.reset_hold_block()
-                self.hold.draw(screen, 60, 130)
-
-        # Draw next blocks
-        for i, block in enumerate(self.next_blocks):
-            x_offset = 0
-            y_offset = 0
-            if self.next_blocks[i].id == 3:
-                x_offset = 15
-                y_offset = 10
-            if self.next_blocks[i].id == 4:
-                x_offset = 15
-
-            if paused or game_over:
-                block.draw(screen, 415 - x_offset, 80 + (i * 85) + y_offset, paused=True, game_over=game_over)
-            else:
-                block.draw(screen, 415 - x_offset, 80 + (i * 85) + y_offset)
+    def draw(self, screen, paused=False, game_over=False, piece_offset=0):
+        # piece_offset moves the falling block down by that many pixels, for smooth falling between rows
+        self.renderer.draw_game(screen, self, paused=paused, game_over=game_over, piece_offset=piece_offset)
@@ -0,0 +1,54 @@
+from collections import OrderedDict
+import pygame
+
+DIGITS = "-0123456789"
+
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, text, color), the least recently used one is dropped once full
+    def __init__(self, capacity=128):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, True, color)
+            if len(self.surfaces) > self.capacity:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
+class DigitAtlas:
+    # Every digit of one font and color rendered once, numbers are put together from these glyphs
+    def __init__(self, font, color):
+        self.glyphs = {digit: font.render(digit, True, color) for digit in DIGITS}
+        self.height = max(glyph.get_height() for glyph in self.glyphs.values())
+
+    def render(self, value):
+        glyphs = [self.glyphs[digit] for digit in str(value)]
+        surface = pygame.Surface((sum(glyph.get_width() for glyph in glyphs), self.height), pygame.SRCALPHA)
+        x = 0
+        for glyph in glyphs:
+            surface.blit(glyph, (x, 0))
+            x += glyph.get_width()
+        return surface
+
+
+class NumberField:
+    # A number shown on the HUD, its surface is only put together again when the value changes
+    def __init__(self, atlas):
+        self.atlas = atlas
+        self.value = None
+        self.surface = None
+
+    def update(self, value):
+        # Returns whether the value changed since the last update
+        if value == self.value:
+            return False
+        self.value = value
+        self.surface = self.atlas.render(value)
+        return True
@@ -1,28 +1,69 @@
+import time
+launched = time.perf_counter()  # before pygame is imported, so the startup report covers the whole launch
+import argparse
+import os
 import sys
+import pygame
+import assets
+from actions import *
+from bitboard import BitboardGrid
+from controls import DEFAULT_HANDLING, Handling, InputHandler
+from events import FORMATS, EventStream, open_target
 from game import Game
+from hud import DigitAtlas, NumberField, TextCache
+from profiler import Profiler, ProfilerOverlay
+from renderer import IncrementalRenderer, Layout, fitting_cell_size
+from replay import ReplayRecorder
+from store import ScoreStore
+from timing import TICK_MS, FixedStepScheduler
 from utilities import *
 
-pygame.init()
-opening_sound = pygame.mixer.Sound("resources/openingscreen.wav")
-opening_sound.play()
-programIcon = pygame.image.load('resources/gamepad_8141286.png')
-pygame.display.set_icon(programIcon)
-title_font = pygame.font.Font("resources/PressStart2P-Regular.ttf", 32)
-standard_font = pygame.font.Font("resources/PressStart2P-Regular.ttf", 16)
-instructions_font = pygame.font.Font("resources/PressStart2P-Regular.ttf", 10)
-screen_width = 600
-screen_height = 520
+parser = argparse.ArgumentParser(description="Play Tetris.")
+parser.add_argument("--rows", type=int, default=NUM_ROWS)
+parser.add_argument("--columns", type=int, default=NUM_COLS)
+parser.add_argument("--cell-size", type=int, help="pixels per cell (default: the largest that fits the screen)")
+parser.add_argument("--das", type=float, default=DEFAULT_HANDLING.das,
+                    help="ms left or right is held before it repeats (default %(default)s)")
+parser.add_argument("--arr", type=float, default=DEFAULT_HANDLING.arr,
+                    help="ms between repeats, 0 for straight to the wall (default %(default)s)")
+parser.add_argument("--soft-drop-factor", type=float, default=DEFAULT_HANDLING.soft_drop_factor,
+                    help="how many times faster than gravity a held soft drop falls (default %(default)s)")
+parser.add_argument("--events", metavar="TARGET", help="stream game events to a file or a HOST:PORT socket")
+parser.add_argument("--events-format", choices=FORMATS, default="json")
+options = parser.parse_args()
+if options.soft_drop_factor <= 0:
+    parser.error("--soft-drop-factor must be positive")
+cell_size = options.cell_size if options.cell_size is not None else fitting_cell_size(options.rows, options.columns)
+try:
+    grid = BitboardGrid(options.rows, options.columns, cell_size)
+except ValueError as error:
+    parser.error(str(error))
+layout = Layout(grid.num_rows, grid.num_cols, grid.cell_size)
+
+startup = assets.StartupTimer(launched)
+startup.mark("imports")
+assets.init()
+# The opening sound, the game sounds and the music load in the background while the start screen shows
+preloader = assets.preload(("openingscreen.wav", "rotate.wav", "clear.wav"), assets.MUSIC, play="openingscreen.wav",
+                           timer=startup)
+pygame.display.set_icon(assets.image("gamepad_8141286.png"))
+title_font = assets.font(32)
+standard_font = assets.font(16)
+screen_width = layout.screen_width
+screen_height = layout.screen_height
 screen = pygame.display.set_mode((screen_width, screen_height))
 pygame.display.set_caption("Tetris")
 clock = pygame.time.Clock()
-title_surface = title_font.render("T E T R I S", True, Colors.neon_yellow)
-title_message_surface = standard_font.render("Press any key to continue...", True, Colors.white)
+hud_text = TextCache()
+title_surface = hud_text.render(title_font, "T E T R I S", Colors.neon_yellow)
+title_message_surface = hud_text.render(standard_font, "Press any key to continue...", Colors.white)
 
 # Starting Screen
 start_screen = True
 blink_timer = pygame.time.get_ticks()
 blink_interval = 500
 show_press_any_key = True
+first_frame = True
 while start_screen:
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
@@ -46,94 +87,190 @@ while start_screen:
         screen.blit(title_message_surface, press_any_key_rect)
 
     pygame.display.update()
+    if first_frame:
+        startup.mark("first frame")
+        first_frame = False
     clock.tick(60)
 
 # Game Screen
-user_game = Game()
-GAME_UPDATE = pygame.USEREVENT
-pygame.time.set_timer(GAME_UPDATE, 400)
-pygame.mixer.music.load("resources/music.mp3")
-pygame.mixer.music.play(-1)
-hold_rect = pygame.Rect(30, 100, 130, 110)
-score_rect = pygame.Rect(10, 300, 170, 60)
-next_rect = pygame.Rect(455, 40, 130, 470)
-game_over_rect = pygame.Rect(125, 250, 50, 50)
-score_surface = standard_font.render("s c o r e", True, Colors.white)
-hold_surface = standard_font.render("h o l d", True, Colors.white)
-next_surface = standard_font.render("n e x t", True, Colors.white)
-pause_surface = title_font.render("p a u s e", True, Colors.neon_yellow)
-game_over_surface = title_font.render("G A M E  O V E R !", True, Colors.neon_yellow)
+score_rect = layout.score_rect
+game_renderer = IncrementalRenderer(layout)
+preloader.join()
+user_game = Game(renderer=game_renderer, grid=grid)
+event_stream = None
+if options.events:
+    event_stream = EventStream(open_target(options.events), options.events_format)
+    event_stream.attach(user_game)
+if assets.load_music():
+    pygame.mixer.music.play(-1)
+print(startup.report())
+score_surface = hud_text.render(standard_font, "s c o r e", Colors.white)
+hold_surface = hud_text.render(standard_font, "h o l d", Colors.white)
+next_surface = hud_text.render(standard_font, "n e x t", Colors.white)
+pause_surface = hud_text.render(title_font, "p a u s e", Colors.neon_yellow)
+game_over_surface = hud_text.render(title_font, "G A M E  O V E R !", Colors.neon_yellow)
+score_field = NumberField(DigitAtlas(standard_font, Colors.white))
 blink_timer = pygame.time.Clock()
 blink_interval = 500
 blink_visible = True
+drawn_screen_state = None
+drawn_score = None
+key_actions = {
+    pygame.K_LEFT: MOVE_LEFT,
+    pygame.K_RIGHT: MOVE_RIGHT,
+    pygame.K_UP: ROTATE,
+    pygame.K_x: ROTATE,
+    pygame.K_z: ROTATE_CCW,
+    pygame.K_a: ROTATE_180,
+    pygame.K_DOWN: SOFT_DROP,
+    pygame.K_SPACE: HARD_DROP,
+    pygame.K_c: HOLD,
+}
+replay_recorder = ReplayRecorder(user_game.seed, num_rows=grid.num_rows, num_cols=grid.num_cols)
+# Finished games and their replays are stored in scores.db by a background writer
+score_store = ScoreStore()
+best_score = score_store.best_score()
+best_surface = None
+
+# F3 shows frame timings and turns the profiler on, F4 starts and stops recording a Chrome trace into traces/
+profiler = Profiler()
+profiler.instrument(game_renderer, "draw_board", "grid_draw")
+profiler.instrument(game_renderer, "draw_panels", "panel_draw")
+profiler_overlay = ProfilerOverlay(profiler, assets.font(8), layout.profiler_rect)
+show_profiler = False
+
+
+def handle_action(action):
+    # Every action reaching the game is recorded so the run can be replayed and its score verified
+    global best_score, best_surface
+    replay_recorder.record(scheduler.action_tick, action)
+    with profiler.section(ACTION_NAMES[action]):
+        user_game.apply_action(action)
+    if user_game.game_over:
+        score_store.record(user_game, scheduler.ticks * TICK_MS / 1000, replay_recorder.finish(user_game))
+        best_score = max(best_score, user_game.score)
+        best_surface = hud_text.render(standard_font, f"b e s t  {best_score}", Colors.white)
+
+
+# Gravity, locking and held keys run on fixed logic ticks, F5 toggles fast-forward
+inputs = InputHandler(key_actions, pygame.key.get_pressed, Handling(options.das, options.arr, options.soft_drop_factor),
+                      num_cols=grid.num_cols)
+scheduler = FixedStepScheduler(user_game, handle_action, inputs=inputs)
+frame_ms = 0
 
 # Game Loop
 game_restart = False
 while True:
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-        if event.type == pygame.KEYDOWN:
-            if user_game.game_over:
-                game_restart = True
-                user_game.game_over = False
-                user_game.reset()
-            if not user_game.game_over and not user_game.pause and not game_restart:
-                if event.key == pygame.K_LEFT:
-                    user_game.move_left()
-                if event.key == pygame.K_RIGHT:
-                    user_game.move_right()
-                if event.key == pygame.K_UP:
-                    user_game.rotate()
-                if event.key == pygame.K_DOWN:
-                    user_game.soft_drop()
-                if event.key == pygame.K_SPACE:
-                    row_dropped_from = user_game.hard_drop()
-                    user_game.update_score(0, row_dropped_from)
-                if event.key == pygame.K_c:
-                    user_game.hold_block()
-            if event.key == pygame.K_ESCAPE and not user_game.game_over:
-                user_game.pause = not user_game.pause
-        if event.type == GAME_UPDATE and not user_game.game_over and not user_game.pause:
-            user_game.soft_drop()
-    if game_restart:
-        game_restart = False
+    profiler.start_frame()
+    with profiler.section("events"):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                score_store.close()
+                if event_stream is not None:
+                    event_stream.close()
+                pygame.quit()
+                sys.exit()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                show_profiler = not show_profiler
+                profiler.set_enabled(show_profiler or profiler.tracing)
+                drawn_screen_state = None
+                continue
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                if profiler.tracing:
+                    os.makedirs("traces", exist_ok=True)
+                    profiler.export_trace(os.path.join("traces", f"trace-{int(time.time())}.json"))
+                    profiler.set_enabled(show_profiler)
+                else:
+                    profiler.set_enabled(True)
+                    profiler.start_trace()
+                continue
+            if event.type == pygame.KEYDOWN:
+                if user_game.game_over:
+                    game_restart = True
+                    user_game.game_over = False
+                    user_game.reset()
+                    replay_recorder = ReplayRecorder(user_game.seed, num_rows=grid.num_rows, num_cols=grid.num_cols)
+                    scheduler.reset()
+                if not user_game.game_over and not user_game.pause and not game_restart:
+                    inputs.press(event.key)
+                if event.key == pygame.K_ESCAPE and not user_game.game_over:
+                    user_game.pause = not user_game.pause
+                    inputs.reset()
+                if event.key == pygame.K_F5:
+                    scheduler.fast_forward = not scheduler.fast_forward
+        if game_restart:
+            game_restart = False
 
-    # Draw the game
-    screen.fill(Colors.black)
-    if user_game.pause or user_game.game_over:
-        pygame.draw.rect(screen, Colors.dark_gray, [0, 0, screen_width, screen_height])
-
-    score_value_surface = standard_font.render(str(user_game.score), True, Colors.white)
-    screen.blit(hold_surface, (40, 70, 50, 50))
-    screen.blit(score_surface, (25, 270, 50, 50))
-    screen.blit(next_surface, (470, 10, 50, 50))
-    pygame.draw.rect(screen, Colors.darkest_gray, hold_rect, 0, 10)
-    pygame.draw.rect(screen, Colors.darkest_gray, score_rect, 0, 10)
-    pygame.draw.rect(screen, Colors.darkest_gray, next_rect, 0, 10)
-    screen.blit(score_value_surface, score_value_surface.get_rect(centerx=score_rect.centerx, centery=score_rect.centery))
-    user_game.draw(screen, paused=user_game.pause, game_over=user_game.game_over)
+    piece_offset = 0
+    if not user_game.game_over and not user_game.pause:
+        with profiler.section("logic"):
+            scheduler.advance(frame_ms)
+            piece_offset = int(scheduler.fall_progress * user_game.grid.cell_size)
 
+    # Draw the game
     if pygame.time.get_ticks() % (2 * blink_interval) < blink_interval:
         blink_visible = True
     else:
         blink_visible = False
 
-    # Pause menu
-    if user_game.pause:
-        pygame.mixer.music.pause()
-        pause_menu_surface = pygame.Surface((250, 200), pygame.SRCALPHA)
-        pause_menu_surface.fill((0, 0, 0, 225))
-        pause_surface_rect = pause_surface.get_rect(center=(screen_width // 2, 240))
-        screen.blit(pause_surface, pause_surface_rect)
-    else:
-        pygame.mixer.music.unpause()
+    # The whole screen is only redrawn when pausing, game over or the game over blink changes it,
+    # otherwise just the score and whatever the renderer reports as changed are updated
+    screen_state = (user_game.pause, user_game.game_over, user_game.game_over and blink_visible)
+    full_redraw = screen_state != drawn_screen_state
+    if full_redraw:
+        drawn_screen_state = screen_state
+        drawn_score = None
+        game_renderer.invalidate()
+        screen.fill(Colors.black)
+        if user_game.pause or user_game.game_over:
+            pygame.draw.rect(screen, Colors.dark_gray, [0, 0, screen_width, screen_height])
+        screen.blit(hold_surface, layout.hold_label)
+        screen.blit(score_surface, layout.score_label)
+        screen.blit(next_surface, layout.next_label)
 
-    if user_game.game_over:
-        if blink_visible:
-            game_over_surface_rect = game_over_surface.get_rect(center=(screen_width // 2, 240))
-            screen.blit(game_over_surface, game_over_surface_rect)
+        # Pause menu
+        if assets.load_music():
+            if user_game.pause:
+                pygame.mixer.music.pause()
+            else:
+                pygame.mixer.music.unpause()
 
-    pygame.display.update()
-    clock.tick(60)
+    score_changed = user_game.score != drawn_score
+    if score_changed:
+        drawn_score = user_game.score
+        with profiler.section("text"):
+            score_field.update(user_game.score)
+            score_value_surface = score_field.surface
+            pygame.draw.rect(screen, Colors.darkest_gray, score_rect, 0, 10)
+            screen.blit(score_value_surface, score_value_surface.get_rect(centerx=score_rect.centerx, centery=score_rect.centery))
+    with profiler.section("game_draw"):
+        user_game.draw(screen, paused=user_game.pause, game_over=user_game.game_over, piece_offset=piece_offset)
+    if show_profiler:
+        with profiler.section("overlay"):
+            overlay_rect = profiler_overlay.draw(screen, Colors.darkest_gray, Colors.white)
+
+    if full_redraw:
+        if user_game.pause:
+            pause_surface_rect = pause_surface.get_rect(center=layout.message_center)
+            screen.blit(pause_surface, pause_surface_rect)
+
+        if user_game.game_over:
+            if blink_visible:
+                game_over_surface_rect = game_over_surface.get_rect(center=layout.message_center)
+                screen.blit(game_over_surface, game_over_surface_rect)
+                best_center = (layout.message_center[0], layout.message_center[1] + 50)
+                screen.blit(best_surface, best_surface.get_rect(center=best_center))
+
+        with profiler.section("display"):
+            pygame.display.update()
+    else:
+        dirty_rects = game_renderer.dirty_rects
+        if score_changed:
+            dirty_rects.append(score_rect)
+        if show_profiler:
+            dirty_rects.append(overlay_rect)
+        if dirty_rects:
+            with profiler.section("display"):
+                pygame.display.update(dirty_rects)
+    profiler.end_frame()
+    frame_ms = clock.tick(60)
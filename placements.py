@@ -0,0 +1,401 @@
+from collections import namedtuple
+from operator import lshift
+from actions import HARD_DROP, MOVE_LEFT, MOVE_RIGHT, ROTATE, ROTATE_180, ROTATE_CCW, SOFT_DROP
+from bitboard import PIECE_MASKS, WALL
+from features import board_features
+from rotation import KICKS, kick
+from utilities import *
+
+CACHE_SIZE = 4096  # searches kept memoized
+ROW_BASE = 2  # rows above the board a resting or moving block's top left corner can be in
+
+# Spawn (row, column) of each block id on a standard width board, taken from the block constructors
+SPAWNS = {block.id: (block.row_offset, block.column_offset)
+          for block in (IBlock(), JBlock(), LBlock(), OBlock(), SBlock(), TBlock(), ZBlock())}
+
+
+def _duplicates(rotations):
+    # Rotations covering the same cells as an earlier rotation moved by (rows, columns), as
+    # rotation -> (earlier rotation, rows, columns). These are the symmetric rotations of S, Z and I
+    duplicates = {}
+    for rotation, cells in enumerate(rotations):
+        for earlier in range(rotation):
+            rows = min(cell.row for cell in cells) - min(cell.row for cell in rotations[earlier])
+            columns = min(cell.column for cell in cells) - min(cell.column for cell in rotations[earlier])
+            if sorted(cells) == sorted(Coordinate(cell.row + rows, cell.column + columns)
+                                       for cell in rotations[earlier]):
+                duplicates[rotation] = (earlier, rows, columns)
+                break
+    return duplicates
+
+
+DUPLICATES = {block_id: _duplicates(rotations) for block_id, rotations in SHAPES.items()}
+
+# Lowest and highest column and row of the cells of each rotation
+EXTENTS = {block_id: tuple((min(cell.column for cell in cells), max(cell.column for cell in cells),
+                            min(cell.row for cell in cells), max(cell.row for cell in cells)) for cells in rotations)
+           for block_id, rotations in SHAPES.items()}
+# Most rows or columns a kick moves a block by
+KICK_REACH = max(max(abs(row_kick), abs(column_kick)) for table in KICKS.values() for turns in table
+                 for offsets in turns for row_kick, column_kick in offsets)
+BAND = 6  # empty rows above the stack a search starts in, instead of at the start position
+
+_cache = {}
+_tables = {}
+_boards = {}
+
+
+def _board_tables(block_id, stride, num_cols, num_rows):
+    # Shifts of the whole board search for one block and a board num_rows rows high, where position (row, column)
+    # is bit row * stride + column + WALL: the distinct bit offsets of the cells of all rotations, per rotation
+    # the indexes of its cells in them, per rotation and turn the rotation turned to and the shift of each kick,
+    # the steps of the sideways and drop fills, the mask of positions on the board and per duplicate rotation
+    # (rotation, earlier rotation, bit offset). Kicks are tried on positions moved up by margin, so that every
+    # kick is a right shift. A search leaving out rows at the top shifts the mask down, the rest stays the same
+    key = (block_id, stride, num_cols, num_rows)
+    tables = _tables.get(key)
+    if tables is None:
+        rotations = SHAPES[block_id]
+        num_rotations = len(rotations)
+        offsets = sorted({cell.row * stride + cell.column for cells in rotations for cell in cells})
+        cells = tuple(tuple(offsets.index(cell.row * stride + cell.column) for cell in cells) for cells in rotations)
+        margin = KICK_REACH * stride + KICK_REACH
+        kicks = tuple(tuple(((rotation + turns) % num_rotations,
+                             tuple(margin + row_kick * stride + column_kick
+                                   for row_kick, column_kick in KICKS[block_id][rotation][turns]))
+                            for turns in range(1, num_rotations))
+                      for rotation in range(num_rotations))
+        # Doubling steps, enough to fill across the widest and the tallest run of positions
+        sideways = []
+        step = 1
+        while step < num_cols:
+            sideways.append(step)
+            step <<= 1
+        height = num_rows + ROW_BASE
+        drops = []
+        step = stride
+        while step < height * stride:
+            drops.append(step)
+            step <<= 1
+        inside = (1 << height * stride) - 1
+        duplicates = tuple((rotation, earlier, rows * stride + columns)
+                           for rotation, (earlier, rows, columns) in DUPLICATES[block_id].items())
+        tables = _tables[key] = (tuple(offsets), cells, kicks, tuple(sideways), tuple(drops), inside, duplicates)
+    return tables
+
+
+def _empty_board(full_row, num_rows):
+    # The walls around a board as one int, ROW_BASE rows above it and 4 below, the shift of each row of the board
+    # in that int and the int of the empty board
+    key = (full_row, num_rows)
+    board = _boards.get(key)
+    if board is None:
+        stride = full_row.bit_length()
+        empty_row = full_row ^ ((1 << stride - 2 * WALL) - 1) << WALL
+        shifts = tuple((row + ROW_BASE) * stride for row in range(num_rows))
+        walls = 0
+        for mask in reversed((full_row,) * ROW_BASE + (0,) * num_rows + (full_row,) * 4):
+            walls = walls << stride | mask
+        board = _boards[key] = (walls, shifts, walls | sum(empty_row << shift for shift in shifts))
+    return board
+
+
+class Placement(namedtuple("Placement", ["block_id", "rotation", "row", "column", "board", "full_row", "start"])):
+    # A resting position of a block on board (BitboardGrid row masks), reachable from the start position.
+    # The resulting board and the actions leading there are only worked out when asked for
+    __slots__ = ()
+
+    @property
+    def cells(self):
+        return [(self.row + cell.row, self.column + cell.column) for cell in SHAPES[self.block_id][self.rotation]]
+
+    @property
+    def rows(self):
+        # Board after locking the block and clearing full rows
+        return self._lock()[0]
+
+    @property
+    def lines_cleared(self):
+        return self._lock()[1]
+
+    @property
+    def features(self):
+        # Features of the board after locking, see features.py
+        return board_features(self.rows, self.full_row)
+
+    def _lock(self):
+        board = list(self.board)
+        for row_delta, mask in PIECE_MASKS[self.block_id][self.rotation]:
+            board[self.row + row_delta] |= mask << (self.column + WALL)
+        # Row 0 is never cleared, same as Grid.clear_full_rows
+        kept = [mask for mask in board[1:] if mask != self.full_row]
+        lines_cleared = len(board) - 1 - len(kept)
+        if lines_cleared:
+            num_cols = self.full_row.bit_length() - 2 * WALL
+            empty_row = self.full_row ^ (((1 << num_cols) - 1) << WALL)
+            board = [board[0]] + [empty_row] * lines_cleared + kept
+        return tuple(board), lines_cleared
+
+    @property
+    def actions(self):
+        # Shortest list of actions from the start position to this placement, ending in a hard drop
+        return find_path(self.board, self.full_row, self.block_id, self.start, self)
+
+
+def _in_empty_rows(extents, row, column, num_cols, first):
+    # Whether a block whose cells span extents (see EXTENTS) is on the board at (row, column), above row first
+    min_column, max_column, min_row, max_row = extents
+    return column + min_column >= 0 and column + max_column < num_cols and row + min_row >= 0 and row + max_row < first
+
+
+# Builds a Placement without going through the keyword handling of the namedtuple constructor
+_new_placement = tuple.__new__
+
+
+def find_placements(rows, full_row, block_id, rotation, row, column):
+    # Every resting position reachable from the given block position with the moves and SRS rotations of Game.
+    # rows are BitboardGrid row masks and are never modified. Placements covering the same cells (the symmetric
+    # rotations of O, S, Z and I) are returned once. Results are memoized per board and start position.
+    #
+    # The whole board is one int, stride bits per row, so for every rotation the positions where the block fits
+    # and the positions reached so far are single ints too. Moving right is a carry through runs of fitting
+    # positions, moving left and dropping are doubling fills, and each kick of a rotation is one shift and mask
+    # for every reached position at once. The ints are never negative, CPython is slower at those
+    rows = tuple(rows)
+    start = (rotation, row, column)
+    cache_key = (block_id, start, rows)
+    placements = _cache.get(cache_key)
+    if placements is not None:
+        return placements
+
+    num_rows = len(rows)
+    stride = full_row.bit_length()
+    num_cols = stride - 2 * WALL
+    walls, shifts, empty = _empty_board(full_row, num_rows)
+    board = walls | sum(map(lshift, rows, shifts))
+    changed = board ^ empty
+    # First row with anything in it
+    first = ((changed ^ changed - 1).bit_length() - 1) // stride - ROW_BASE if changed else num_rows
+    # With BAND empty rows between the start and the stack the block can get to any position in them, in any
+    # rotation, so the search starts from all of those and leaves out the rows above. top is the first row the
+    # search covers
+    top = first - BAND
+    band = top >= row and top >= 0
+    if band:
+        # A start off the sides or the top of the board reaches nothing
+        min_column, max_column, min_row, _ = EXTENTS[block_id][rotation]
+        if column + min_column < 0 or column + max_column >= num_cols or row + min_row < 0:
+            return []
+        board >>= (top + ROW_BASE) * stride
+    else:
+        top = -ROW_BASE
+    offsets, cells, kicks, sideways, drops, inside, duplicates = _board_tables(block_id, stride, num_cols, num_rows)
+    inside >>= (top + ROW_BASE) * stride
+    shifted = [board >> offset for offset in offsets]
+    fits = []
+    for indexes in cells:
+        blocked = 0
+        for index in indexes:
+            blocked |= shifted[index]
+        fits.append(inside ^ inside & blocked)
+
+    num_rotations = len(fits)
+    if band:
+        seeds = [fit & (1 << (BAND - extents[3]) * stride) - 1 for fit, extents in zip(fits, EXTENTS[block_id])]
+    else:
+        # A block starting up in the empty rows can turn in place to every rotation that fits there, and then
+        # move anywhere along the row
+        seeds = [0] * num_rotations
+        if _in_empty_rows(EXTENTS[block_id][rotation], row, column, num_cols, first):
+            start_row = (1 << stride) - 1 << (row + ROW_BASE) * stride
+            for current, extents in enumerate(EXTENTS[block_id]):
+                if _in_empty_rows(extents, row, column, num_cols, first):
+                    seeds[current] = fits[current] & start_row
+    if any(seeds):
+        # Whole rows of positions are closed sideways already, they only need dropping. Every rotation is closed
+        # before any kicks are tried, kicks from the positions reached that way are deferred
+        reach = []
+        for fit, dropped in zip(fits, seeds):
+            run = fit
+            for step in drops:
+                filled = dropped | run & dropped << step
+                if filled == dropped:
+                    break
+                dropped = filled
+                run &= run << step
+            reach.append(dropped)
+        closed = seeds
+        todo = [current for current in range(num_rotations) if seeds[current]]
+        deferred = []
+    else:
+        reach = [0] * num_rotations
+        position = (row + ROW_BASE) * stride + column + WALL
+        if 0 <= column + WALL < stride and row >= -ROW_BASE and fits[rotation] >> position & 1:
+            reach[rotation] = 1 << position
+        closed = [0] * num_rotations
+        todo = [rotation] if reach[rotation] else []
+        deferred = None
+    seen = [0] * num_rotations
+    raised = [None] * num_rotations
+    near = [0] * num_rotations
+    margin = KICK_REACH * stride + KICK_REACH
+    while todo:
+        current = todo.pop()
+        fit = fits[current]
+        reached = reach[current]
+        # Closing a rotation again only pays when what was added since can move somewhere new
+        added = reached ^ closed[current]
+        if not closed[current] or (fit ^ reached) & (added << 1 | added >> 1 | added << stride):
+            while True:
+                reached |= fit ^ fit & (fit + reached)
+                run = fit
+                # A fill stops at the first step that adds nothing, the runs it fills are done then
+                for step in sideways:
+                    filled = reached | run & reached >> step
+                    if filled == reached:
+                        break
+                    reached = filled
+                    run &= run >> step
+                dropped = reached
+                run = fit
+                for step in drops:
+                    filled = dropped | run & dropped << step
+                    if filled == dropped:
+                        break
+                    dropped = filled
+                    run &= run << step
+                added = dropped ^ reached
+                reached = dropped
+                if not (fit ^ reached) & (added << 1 | added >> 1):
+                    break
+        reach[current] = reached
+        closed[current] = reached
+        if deferred is not None:
+            deferred.append(current)
+            if not todo:
+                todo = deferred
+                deferred = None
+            continue
+        new = reached ^ seen[current]
+        seen[current] = reached
+        for rotated, kick_shifts in kicks[current]:
+            # Only kicks into a fitting position not reached yet can add anything
+            missing = fits[rotated] ^ reach[rotated]
+            if not missing:
+                continue
+            target = raised[rotated]
+            if target is None:
+                target = raised[rotated] = fits[rotated] << margin
+                # Only positions within KICK_REACH rows and columns of a missing one can kick into it. Reach only
+                # grows, so this stays good for the rest of the search
+                spread = missing | missing << 1 | missing >> 1
+                spread |= spread << 1 | spread >> 1
+                spread |= spread << stride | spread >> stride
+                near[rotated] = spread | spread << stride | spread >> stride
+            # Positions the first kick does not fit try the next one, and so on
+            remaining = new & near[rotated]
+            if not remaining:
+                continue
+            moved = 0
+            for shift in kick_shifts:
+                kicked = remaining & target >> shift
+                moved |= kicked << shift
+                remaining ^= kicked
+                if not remaining:
+                    break
+            moved >>= margin
+            if moved & missing:
+                reach[rotated] |= moved
+                if rotated not in todo:
+                    todo.append(rotated)
+
+    # Resting positions are the reached ones the block cannot drop from. Symmetric rotations fold into the
+    # rotation they duplicate
+    resting = [reached ^ reached & fit >> stride for fit, reached in zip(fits, reach)]
+    for current, earlier, offset in duplicates:
+        resting[earlier] |= resting[current] << offset if offset >= 0 else resting[current] >> -offset
+        resting[current] = 0
+
+    placements = []
+    for current, positions in enumerate(resting):
+        # Highest position first, which is cheaper to take off, and then back into order
+        found = []
+        while positions:
+            bit = positions.bit_length() - 1
+            positions ^= 1 << bit
+            row, column = divmod(bit, stride)
+            found.append(_new_placement(Placement, (block_id, current, row + top, column - WALL, rows, full_row,
+                                                    start)))
+        found.reverse()
+        placements += found
+
+    if len(_cache) >= CACHE_SIZE:
+        _cache.clear()
+    _cache[cache_key] = placements
+    return placements
+
+
+def find_path(rows, full_row, block_id, start, placement):
+    # Breadth first search over single positions from start until the block rests on the placement's cells
+    masks = PIECE_MASKS[block_id]
+    num_rotations = len(masks)
+    num_rows = len(rows)
+    target = sorted(placement.cells)
+
+    def fits(block_id, rotation, row, column):
+        if column + WALL < 0:
+            return False
+        for row_delta, mask in masks[rotation]:
+            mask <<= column + WALL
+            if not 0 <= row + row_delta < num_rows or mask & rows[row + row_delta] or mask > full_row:
+                return False
+        return True
+
+    parents = {start: None}
+    queue = [start]
+    for state in queue:
+        rotation, row, column = state
+        if not fits(block_id, rotation, row + 1, column) and sorted(
+                (row + cell.row, column + cell.column) for cell in SHAPES[block_id][rotation]) == target:
+            path = []
+            while parents[state] is not None:
+                state, action = parents[state]
+                path.append(action)
+            path.reverse()
+            while path and path[-1] == SOFT_DROP:
+                path.pop()
+            path.append(HARD_DROP)
+            return path
+
+        moves = [(MOVE_LEFT, (rotation, row, column - 1)), (MOVE_RIGHT, (rotation, row, column + 1)),
+                 (SOFT_DROP, (rotation, row + 1, column))]
+        if num_rotations > 1:
+            for action, turns in ((ROTATE, 1), (ROTATE_180, 2), (ROTATE_CCW, 3)):
+                rotated = kick(fits, block_id, rotation, row, column, turns)
+                if rotated is not None:
+                    moves.append((action, rotated))
+        for action, next_state in moves:
+            if next_state not in parents and fits(block_id, *next_state):
+                parents[next_state] = (state, action)
+                queue.append(next_state)
+    return None
+
+
+def game_placements(game):
+    # Placements for the current block and for the block a hold would bring in, without touching the game.
+    # The game's grid has to be a BitboardGrid
+    block = game.current_block
+    current = find_placements(game.grid.rows, game.grid.full_row, block.id, block.rotation_state, block.row_offset,
+                              block.column_offset)
+    if game.hold_swapped_this_drop:
+        return current, []
+    if game.hold is None:
+        if not game.next_blocks:
+            return current, []
+        held = game.next_blocks[0]
+        row, column = SPAWNS[held.id]
+        return current, find_placements(game.grid.rows, game.grid.full_row, held.id, 0, row,
+                                        column + game.spawn_shift)
+    # Swapping keeps the held rotation and brings the block back in at row 0, column 3 of a standard board
+    return current, find_placements(game.grid.rows, game.grid.full_row, game.hold.id, game.hold.rotation_state, 0,
+                                    3 + game.spawn_shift)
@@ -0,0 +1,167 @@
+import json
+import time
+from array import array
+
+FRAME = "frame"
+CAPACITY = 600  # frames kept per section, ten seconds at 60 fps
+MAX_TRACE_EVENTS = 500000  # trace recording stops on its own past this many events
+
+
+class RingBuffer:
+    # Fixed size buffer of the latest timings in milliseconds, older values are overwritten
+    def __init__(self, capacity=CAPACITY):
+        self.values = array("d", bytes(8 * capacity))
+        self.capacity = capacity
+        self.count = 0
+        self.index = 0
+
+    def add(self, value):
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def percentiles(self, *percents):
+        ordered = sorted(self.values[:self.count])
+        if not ordered:
+            return tuple(0.0 for _ in percents)
+        return tuple(ordered[min(self.count - 1, int(percent / 100 * self.count))] for percent in percents)
+
+
+class _NullSection:
+    # Handed out while the profiler is disabled so an untimed section costs one call and nothing else
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SECTION = _NullSection()
+
+
+class _Section:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    # Times named sections of each frame into per-section ring buffers. While tracing every section is also
+    # kept as a Chrome trace event (chrome://tracing, Perfetto) until export_trace writes them out.
+    # Nothing is measured while disabled
+    def __init__(self, enabled=False, capacity=CAPACITY):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.buffers = {}
+        self.sections = {}
+        self.tracing = False
+        self.trace_events = []
+        self.frame_start = 0
+        self.origin = time.perf_counter_ns()
+
+    def section(self, name):
+        if not self.enabled:
+            return NULL_SECTION
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = _Section(self, name)
+        return section
+
+    def record(self, name, start, end):
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = self.buffers[name] = RingBuffer(self.capacity)
+        buffer.add((end - start) / 1e6)
+        if self.tracing:
+            self.trace_events.append({"name": name, "ph": "X", "pid": 0, "tid": 0,
+                                      "ts": (start - self.origin) / 1000, "dur": (end - start) / 1000})
+            if len(self.trace_events) >= MAX_TRACE_EVENTS:
+                self.tracing = False
+
+    def start_frame(self):
+        if self.enabled:
+            self.frame_start = time.perf_counter_ns()
+
+    def end_frame(self):
+        if self.enabled and self.frame_start:
+            self.record(FRAME, self.frame_start, time.perf_counter_ns())
+
+    def instrument(self, instance, method_name, name=None):
+        # Replaces a method on this one instance with a version timed as its own section
+        method = getattr(instance, method_name)
+        name = name or method_name
+
+        def timed(*args, **kwargs):
+            if not self.enabled:
+                return method(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.record(name, start, time.perf_counter_ns())
+
+        setattr(instance, method_name, timed)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.frame_start = 0
+
+    def summary(self, *percents):
+        # section -> percentiles in milliseconds, the frame first and then the slowest sections at the top
+        percents = percents or (50, 95, 99)
+        summary = {name: buffer.percentiles(*percents) for name, buffer in self.buffers.items()}
+        return dict(sorted(summary.items(), key=lambda item: (item[0] != FRAME, -item[1][-1])))
+
+    def start_trace(self):
+        self.trace_events = []
+        self.tracing = True
+
+    def export_trace(self, path):
+        self.tracing = False
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": self.trace_events, "displayTimeUnit": "ms"}, trace_file)
+        self.trace_events = []
+        return path
+
+
+class ProfilerOverlay:
+    # Small opaque table of p50 and p99 section times, re-rendered a few times a second rather than every frame
+    def __init__(self, profiler, font, rect, refresh_frames=30):
+        self.profiler = profiler
+        self.font = font
+        self.rect = rect
+        self.refresh_frames = refresh_frames
+        self.frames = 0
+        self.surface = None
+
+    def draw(self, screen, background, foreground):
+        if self.surface is None or self.frames % self.refresh_frames == 0:
+            self.surface = self.render(background, foreground)
+        self.frames += 1
+        screen.blit(self.surface, self.rect)
+        return self.rect
+
+    def render(self, background, foreground):
+        import pygame
+
+        surface = pygame.Surface(self.rect.size)
+        surface.fill(background)
+        line_height = self.font.get_linesize() + 2
+        lines = [f"{'ms rec' if self.profiler.tracing else 'ms':10} {'p50':>5} {'p99':>5}"]
+        for name, (p50, p99) in self.profiler.summary(50, 99).items():
+            lines.append(f"{name[:10]:10} {p50:5.2f} {p99:5.2f}")
+        for index, line in enumerate(lines[:self.rect.height // line_height]):
+            surface.blit(self.font.render(line, True, foreground), (4, 4 + index * line_height))
+        return surface
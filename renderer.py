@@ -0,0 +1,257 @@
+import pygame
+from itertools import zip_longest
+from utilities import CELL_SIZE, NUM_COLS, NUM_ROWS, Colors
+
+TRANSPARENT = (255, 0, 255)  # colour key of cell sprites without a background, not in any palette
+
+
+def cell_style(cell_size):
+    # Side length and border width of a drawn cell, the rest of the cell is the gap to its neighbours. Cells too
+    # small for an outline are drawn filled
+    inner = cell_size - max(1, cell_size * 4 // CELL_SIZE)
+    return inner, 3 if cell_size >= 12 else 0
+
+
+def fitting_cell_size(num_rows, num_cols, height=NUM_ROWS * CELL_SIZE, width=4 * NUM_COLS * CELL_SIZE):
+    # Largest cell size up to CELL_SIZE that keeps a board within height and width pixels
+    return max(1, min(CELL_SIZE, height // num_rows, width // num_cols))
+
+
+class Layout:
+    # Screen positions around a board of num_rows by num_cols cells of cell_size pixels. The hold and score panels
+    # sit left of the board and the next panel right of it, the screen grows with the board. The standard board
+    # gives the original 600x520 screen
+    def __init__(self, num_rows=NUM_ROWS, num_cols=NUM_COLS, cell_size=CELL_SIZE):
+        self.board_x = 190
+        self.board_y = 11
+        board_width = num_cols * cell_size
+        board_height = num_rows * cell_size
+        self.hold_rect = pygame.Rect(30, 100, 130, 110)
+        self.hold_block = (60, 130)
+        self.score_rect = pygame.Rect(10, 300, 170, 60)
+        self.next_rect = pygame.Rect(self.board_x + board_width + 15, 40, 130, 470)
+        self.next_block = (self.next_rect.x - 40, 80)
+        self.next_spacing = 85
+        self.hold_label = (40, 70)
+        self.score_label = (25, 270)
+        self.next_label = (self.next_rect.x + 15, 10)
+        self.profiler_rect = pygame.Rect(5, 370, 183, 145)
+        self.screen_width = self.next_rect.right + 15
+        self.screen_height = max(520, self.board_y + board_height + 9)
+        self.message_center = (self.screen_width // 2, self.screen_height // 2 - 20)
+
+    def next_position(self, index, block):
+        # The I and O blocks are moved to line up with the three wide blocks
+        x_offset = 0
+        y_offset = 0
+        if block.id == 3:
+            x_offset = 15
+            y_offset = 10
+        if block.id == 4:
+            x_offset = 15
+        return self.next_block[0] - x_offset, self.next_block[1] + index * self.next_spacing + y_offset
+
+
+class PygameRenderer:
+    def __init__(self, layout=None):
+        self.layout = layout if layout is not None else Layout()
+        self.board_x = self.layout.board_x
+        self.board_y = self.layout.board_y
+
+    def draw_grid(self, screen, grid, paused=False, game_over=False):
+        palette = Colors.get_grays() if paused or game_over else Colors.get_colors()
+        inner, border = cell_style(grid.cell_size)
+        for row in range(grid.num_rows):
+            for col in range(grid.num_cols):
+                cell_rect = pygame.Rect(col * grid.cell_size + self.board_x, row * grid.cell_size + self.board_y,
+                                        inner, inner)
+                pygame.draw.rect(screen, palette[grid.cells[row][col]], cell_rect, border)
+
+    def draw_block(self, screen, block, offset_x, offset_y, paused=False, game_over=False, cell_size=None):
+        # Blocks are drawn at block.cell_size unless a cell_size is given, as for the board's own cells
+        palette = Colors.get_grays() if paused or game_over else Colors.get_colors()
+        size = cell_size if cell_size is not None else block.cell_size
+        inner, border = cell_style(size)
+        for cell in block.get_cell_positions():
+            cell_rect = pygame.Rect(offset_x + cell.column * size, offset_y + cell.row * size, inner, inner)
+            pygame.draw.rect(screen, palette[block.id], cell_rect, border)
+
+    def draw_game(self, screen, game, paused=False, game_over=False, piece_offset=0):
+        # Draw the grid, occupied cells are drawn in their block colour by the same pass
+        self.draw_grid(screen, game.grid, paused=paused, game_over=game_over)
+
+        # Draw the current block
+        self.draw_block(screen, game.current_block, self.board_x, self.board_y + piece_offset, paused=paused,
+                        game_over=game_over, cell_size=game.grid.cell_size)
+
+        # Draw hold block
+        if game.hold is not None:
+            self.draw_block(screen, game.hold, *self.layout.hold_block, paused=paused, game_over=game_over)
+
+        # Draw next blocks
+        for i, block in enumerate(game.next_blocks):
+            self.draw_block(screen, block, *self.layout.next_position(i, block), paused=paused, game_over=game_over)
+
+
+class IncrementalRenderer(PygameRenderer):
+    # Only redraws board cells and side panels that changed since the last frame, using one pre-rendered
+    # sprite per colour and background. The screen areas touched by a frame are collected in dirty_rects
+    def __init__(self, layout=None):
+        super().__init__(layout)
+        self.hold_rect = self.layout.hold_rect
+        self.next_rect = self.layout.next_rect
+        self.sprites = {}
+        self.panel_backgrounds = {}
+        self.dirty_rects = []
+        self.invalidate()
+
+    def invalidate(self):
+        # Forget everything drawn so far, the next frame redraws the board and panels in full
+        self.rows = None
+        self.piece_cells = ()
+        self.piece_offset = 0
+        self.panels = None
+        self.slot_rects = []  # per panel slot (hold, then each next block), the screen area of its block or None
+
+    def cell_sprite(self, color, background, cell_size):
+        # A background of None leaves everything but the cell itself transparent, as drawing it in place would
+        key = (color, background, cell_size)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            sprite = pygame.Surface((cell_size, cell_size))
+            sprite.fill(background if background is not None else TRANSPARENT)
+            inner, border = cell_style(cell_size)
+            pygame.draw.rect(sprite, color, (0, 0, inner, inner), border)
+            if background is None:
+                sprite.set_colorkey(TRANSPARENT, pygame.RLEACCEL)
+            self.sprites[key] = sprite
+        return sprite
+
+    def panel_background(self, background):
+        # The screen with nothing but the empty panels on it, for putting back what a panel block covered
+        surface = self.panel_backgrounds.get(background)
+        if surface is None:
+            surface = pygame.Surface((self.layout.screen_width, self.layout.screen_height))
+            surface.fill(background)
+            pygame.draw.rect(surface, Colors.darkest_gray, self.hold_rect, 0, 10)
+            pygame.draw.rect(surface, Colors.darkest_gray, self.next_rect, 0, 10)
+            self.panel_backgrounds[background] = surface
+        return surface
+
+    def draw_game(self, screen, game, paused=False, game_over=False, piece_offset=0):
+        self.dirty_rects = []
+        self.draw_board(screen, game, paused, game_over, piece_offset)
+        self.draw_panels(screen, game, paused, game_over)
+
+    def draw_board(self, screen, game, paused, game_over, piece_offset=0):
+        grid = game.grid
+        cells = grid.cells
+        size = grid.cell_size
+        piece = game.current_block
+        piece_cells = piece.get_cell_positions()
+
+        if self.rows is None:
+            dirty = [(row, col) for row in range(grid.num_rows) for col in range(grid.num_cols)]
+            self.rows = list(cells)
+            self.dirty_rects.append(pygame.Rect(self.board_x, self.board_y, grid.num_cols * size,
+                                                grid.num_rows * size))
+            full = True
+        else:
+            dirty = []
+            # Grid rows are copy-on-write, a row that is still the same list as the drawn one has not changed, so
+            # only the rows a placement or line clear replaced are compared cell by cell
+            for row, (drawn, current) in enumerate(zip(self.rows, cells)):
+                if drawn is not current:
+                    dirty.extend((row, col) for col in range(grid.num_cols) if drawn[col] != current[col])
+                    self.rows[row] = current
+            # Positions are memoized per placement, so an unmoved piece gives back the very same tuple.
+            # A piece drawn with an offset also covers part of the cells right below it
+            if piece_cells is not self.piece_cells or piece_offset != self.piece_offset:
+                dirty.extend(self.piece_cells)
+                if self.piece_offset:
+                    dirty.extend((row + 1, col) for row, col in self.piece_cells)
+                dirty.extend(piece_cells)
+                if piece_offset:
+                    dirty.extend((row + 1, col) for row, col in piece_cells)
+            full = False
+        self.piece_cells = piece_cells
+        self.piece_offset = piece_offset
+        if not dirty:
+            return
+
+        palette = Colors.get_grays() if paused or game_over else Colors.get_colors()
+        background = Colors.dark_gray if paused or game_over else Colors.black
+        sprites = [self.cell_sprite(color, background, size) for color in palette]
+        blits = []
+        rects = []
+        for row, col in set(dirty):
+            if not grid.is_inside(row, col):
+                continue
+            value = piece.id if (row, col) in piece_cells and not piece_offset else cells[row][col]
+            position = (col * size + self.board_x, row * size + self.board_y)
+            blits.append((sprites[value], position))
+            rects.append(pygame.Rect(position, (size, size)))
+        screen.blits(blits, False)
+        # A line clear on a big board changes thousands of cells, more than a row's worth go out as one rect
+        if not full and rects:
+            if len(rects) > grid.num_cols:
+                self.dirty_rects.append(rects[0].unionall(rects[1:]))
+            else:
+                self.dirty_rects.extend(rects)
+
+        # The offset piece goes on top of the board cells, only while it can still fall into the row below
+        if piece_offset:
+            sprite = self.cell_sprite(palette[piece.id], background, size)
+            for row, col in piece_cells:
+                if grid.is_inside(row, col):
+                    screen.blit(sprite, (col * size + self.board_x, row * size + self.board_y + piece_offset))
+
+    def draw_panels(self, screen, game, paused, game_over):
+        slots = [(game.hold, *self.layout.hold_block) if game.hold is not None else None]
+        slots.extend((block, *self.layout.next_position(i, block)) for i, block in enumerate(game.next_blocks))
+        panels = [(slot[0].id, slot[0].rotation_state) if slot is not None else None for slot in slots]
+        if panels == self.panels:
+            return
+        palette = Colors.get_grays() if paused or game_over else Colors.get_colors()
+        background = Colors.dark_gray if paused or game_over else Colors.black
+        slot_rects = [self.block_rect(*slot) if slot is not None else None for slot in slots]
+
+        if self.panels is None:
+            pygame.draw.rect(screen, Colors.darkest_gray, self.hold_rect, 0, 10)
+            pygame.draw.rect(screen, Colors.darkest_gray, self.next_rect, 0, 10)
+            areas = [self.hold_rect, self.next_rect]
+            redrawn = range(len(slots))
+        else:
+            # Only the slots showing another block are cleared, of what was drawn there before and of what goes
+            # there now. Some rotations stick out of the panels, so the empty panels are copied back rather than
+            # just filled
+            areas = []
+            for drawn, current, drawn_rect, rect in zip_longest(self.panels, panels, self.slot_rects, slot_rects):
+                if drawn != current:
+                    rects = [area for area in (drawn_rect, rect) if area is not None]
+                    areas.append(rects[0].unionall(rects[1:]))
+            empty = self.panel_background(background)
+            screen.blits([(empty, area, area) for area in areas], False)
+            redrawn = [index for index, rect in enumerate(slot_rects)
+                       if rect is not None and rect.collidelist(areas) != -1]
+
+        # Cell sprites without a background only cover what draw_block would, so blocks go on top of whatever
+        # panel or neighbour is underneath
+        for index in redrawn:
+            if slots[index] is not None:
+                block, offset_x, offset_y = slots[index]
+                sprite = self.cell_sprite(palette[block.id], None, block.cell_size)
+                screen.blits([(sprite, (offset_x + cell.column * block.cell_size,
+                                        offset_y + cell.row * block.cell_size))
+                              for cell in block.get_cell_positions()], False)
+        self.panels = panels
+        self.slot_rects = slot_rects
+        self.dirty_rects.extend(areas)
+
+    def block_rect(self, block, offset_x, offset_y):
+        cells = block.get_cell_positions()
+        rows = [cell.row for cell in cells]
+        columns = [cell.column for cell in cells]
+        return pygame.Rect(offset_x + min(columns) * block.cell_size, offset_y + min(rows) * block.cell_size,
+                           (max(columns) - min(columns) + 1) * block.cell_size,
+                           (max(rows) - min(rows) + 1) * block.cell_size)
@@ -0,0 +1,179 @@
+import hashlib
+import io
+import sys
+from collections import namedtuple
+from actions import ACTION_BITS, GRAVITY, NONE
+from bitboard import BitboardGrid
+from game import Game
+from timing import FixedStepScheduler
+from utilities import MAX_SIZE, MIN_SIZE, NUM_COLS, NUM_ROWS
+
+# Replay layout: MAGIC, VERSION, varint seed, varint board rows and columns, then one varint per action holding
+# (tick delta << ACTION_BITS | action), a zero varint as end marker and finally the varint score and the 8 byte board
+# hash reached at the end of the game. Actions are recorded at the scheduler's action_tick, so those of a tick come
+# before its GRAVITY actions
+MAGIC = b"TTRP"
+VERSION = 4  # 2: SRS rotation and four bit actions, 3: board size, 4: actions at the tick whose gravity follows them
+END = 0
+
+
+class ReplayResult(namedtuple("ReplayResult", ["seed", "score", "board_hash", "expected_score",
+                                               "expected_board_hash", "mismatch_tick"])):
+    # mismatch_tick is the first tick whose recorded gravity the scheduler would not have produced, None if all of
+    # it matched
+    __slots__ = ()
+
+    @property
+    def valid(self):
+        return (self.mismatch_tick is None and self.score == self.expected_score and
+                self.board_hash == self.expected_board_hash)
+
+
+def encode_varint(value):
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def board_hash(grid):
+    return hashlib.blake2b(b"".join(bytes(row) for row in grid.cells), digest_size=8).digest()
+
+
+class ReplayRecorder:
+    def __init__(self, seed, stream=None, num_rows=NUM_ROWS, num_cols=NUM_COLS):
+        self.seed = seed
+        self.stream = stream if stream is not None else io.BytesIO()
+        self.last_tick = 0
+        self.stream.write(MAGIC + bytes([VERSION]) + encode_varint(seed) + encode_varint(num_rows) +
+                          encode_varint(num_cols))
+
+    def record(self, tick, action):
+        if action == NONE:
+            return
+        if tick < self.last_tick:
+            raise ValueError(f"Replay ticks must not go backwards: {tick} after {self.last_tick}")
+        self.stream.write(encode_varint((tick - self.last_tick) << ACTION_BITS | action))
+        self.last_tick = tick
+
+    def finish(self, game):
+        self.stream.write(encode_varint(END) + encode_varint(game.score) + board_hash(game.grid))
+        if isinstance(self.stream, io.BytesIO):
+            return self.stream.getvalue()
+
+
+def read_replay(data):
+    # Returns the seed, the board size as (rows, columns), the list of (tick, action) pairs and the recorded final
+    # score and board hash. Anything that is not a whole replay, or asks for a board no game could have, raises
+    # ValueError before a board gets built for it
+    if data[:len(MAGIC) + 1] != MAGIC + bytes([VERSION]):
+        raise ValueError("Not a replay or unsupported replay version")
+    try:
+        seed, position = decode_varint(data, len(MAGIC) + 1)
+        num_rows, position = decode_varint(data, position)
+        num_cols, position = decode_varint(data, position)
+        if not (MIN_SIZE <= num_rows <= MAX_SIZE and MIN_SIZE <= num_cols <= MAX_SIZE):
+            raise ValueError(f"Replay board size {num_rows}x{num_cols} out of range")
+        actions = []
+        tick = 0
+        action_mask = (1 << ACTION_BITS) - 1
+        while True:
+            value, position = decode_varint(data, position)
+            if value == END:
+                break
+            tick += value >> ACTION_BITS
+            actions.append((tick, value & action_mask))
+        score, position = decode_varint(data, position)
+    except IndexError:
+        raise ValueError("Replay is cut short") from None
+    expected_board_hash = data[position:position + 8]
+    if len(expected_board_hash) != 8:
+        raise ValueError("Replay is cut short")
+    return seed, (num_rows, num_cols), actions, score, expected_board_hash
+
+
+class ReplayInputs:
+    # Stands in for the player's controls.InputHandler when a FixedStepScheduler replays a game: every tick feeds
+    # the recorded player actions of that tick, and every GRAVITY the scheduler applies has to be the next recorded
+    # action. The first tick where the two disagree ends up in mismatch_tick
+    def __init__(self, game, actions):
+        self.game = game
+        self.actions = actions
+        self.position = 0
+        self.tick = 0
+        self.mismatch_tick = None
+
+    def reset(self):
+        pass
+
+    def poll(self, tick, gravity_ms):
+        # Whatever is left of an earlier tick is gravity the scheduler did not apply there
+        self.tick = tick
+        if self.position < len(self.actions) and self.actions[self.position][0] < tick:
+            self.mismatch(self.actions[self.position][0])
+
+    def feed(self, game, apply):
+        actions = self.actions
+        while (self.position < len(actions) and self.mismatch_tick is None and not game.game_over and
+               actions[self.position][0] == self.tick and actions[self.position][1] != GRAVITY):
+            self.position += 1
+            apply(actions[self.position - 1][1])
+
+    def apply(self, action):
+        if action == GRAVITY:
+            if self.position < len(self.actions) and self.actions[self.position] == (self.tick, GRAVITY):
+                self.position += 1
+            else:
+                self.mismatch(self.tick)
+                return
+        self.game.apply_action(action)
+
+    def mismatch(self, tick):
+        if self.mismatch_tick is None:
+            self.mismatch_tick = tick
+
+    @property
+    def done(self):
+        return self.position == len(self.actions) or self.mismatch_tick is not None
+
+
+def play_replay(data):
+    # Re-simulates the replay headlessly as fast as possible. The game runs on a FixedStepScheduler as it did when
+    # recorded, with the player actions put in at their ticks, so gravity and locks come from the scheduler and
+    # have to match the recorded ones
+    seed, (num_rows, num_cols), actions, expected_score, expected_board_hash = read_replay(data)
+    game = Game(headless=True, seed=seed, grid=BitboardGrid(num_rows, num_cols))
+    inputs = ReplayInputs(game, actions)
+    scheduler = FixedStepScheduler(game, inputs.apply, inputs=inputs)
+    while not inputs.done and not game.game_over:
+        scheduler.step()
+    # Actions recorded after the game was over were never played
+    if not inputs.done:
+        inputs.mismatch(actions[inputs.position][0])
+    return ReplayResult(seed, game.score, board_hash(game.grid), expected_score, expected_board_hash,
+                        inputs.mismatch_tick)
+
+
+def verify_replay(data):
+    return play_replay(data).valid
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        with open(path, "rb") as replay_file:
+            result = play_replay(replay_file.read())
+        print(f"{path}: score {result.score} {'ok' if result.valid else 'MISMATCH'}")
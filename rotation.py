@@ -0,0 +1,65 @@
+from utilities import SHAPES
+
+I_BLOCK = 3
+
+# Super Rotation System wall kicks as (x, y) with y pointing up, the way the guideline tables are written.
+# Rotation states go 0, R, 2, L clockwise, matching the order of SHAPES
+_JLSTZ_KICKS = {
+    (0, 1): ((0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)),
+    (1, 0): ((0, 0), (1, 0), (1, -1), (0, 2), (1, 2)),
+    (1, 2): ((0, 0), (1, 0), (1, -1), (0, 2), (1, 2)),
+    (2, 1): ((0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)),
+    (2, 3): ((0, 0), (1, 0), (1, 1), (0, -2), (1, -2)),
+    (3, 2): ((0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)),
+    (3, 0): ((0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)),
+    (0, 3): ((0, 0), (1, 0), (1, 1), (0, -2), (1, -2)),
+}
+_I_KICKS = {
+    (0, 1): ((0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)),
+    (1, 0): ((0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)),
+    (1, 2): ((0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)),
+    (2, 1): ((0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)),
+    (2, 3): ((0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)),
+    (3, 2): ((0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)),
+    (3, 0): ((0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)),
+    (0, 3): ((0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)),
+}
+# SRS has no half turns, these are the 180 degree kicks commonly used alongside it (TETR.IO's SRS+)
+_HALF_TURN_KICKS = {
+    (0, 2): ((0, 0), (0, 1), (1, 1), (-1, 1), (1, 0), (-1, 0)),
+    (2, 0): ((0, 0), (0, -1), (-1, -1), (1, -1), (-1, 0), (1, 0)),
+    (1, 3): ((0, 0), (1, 0), (1, 2), (1, 1), (0, 2), (0, 1)),
+    (3, 1): ((0, 0), (-1, 0), (-1, 2), (-1, 1), (0, 2), (0, 1)),
+}
+
+
+def _kick_table(block_id):
+    # KICKS[block id][from rotation][turns] -> (row, column) offsets to try in order, turns being 1 for
+    # clockwise, 2 for a half turn and 3 for counter clockwise
+    count = len(SHAPES[block_id])
+    kicks = _I_KICKS if block_id == I_BLOCK else _JLSTZ_KICKS
+    table = []
+    for rotation in range(count):
+        offsets = [((0, 0),)]
+        for turns in range(1, 4):
+            target = (rotation + turns) % count
+            if count == 1:
+                offsets.append(((0, 0),))
+            else:
+                pairs = _HALF_TURN_KICKS[(rotation, target)] if turns == 2 else kicks[(rotation, target)]
+                offsets.append(tuple((-y, x) for x, y in pairs))
+        table.append(tuple(offsets))
+    return tuple(table)
+
+
+KICKS = {block_id: _kick_table(block_id) for block_id in SHAPES}
+
+
+def kick(fits, block_id, rotation, row, column, turns):
+    # First position the block fits in after turning, as (rotation, row, column), or None. fits(block_id,
+    # rotation, row, column) is the board test, so nothing gets moved while trying the candidates
+    target = (rotation + turns) % len(SHAPES[block_id])
+    for row_kick, column_kick in KICKS[block_id][rotation][turns]:
+        if fits(block_id, target, row + row_kick, column + column_kick):
+            return target, row + row_kick, column + column_kick
+    return None
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+from actions import GRAVITY, HARD_DROP, HOLD, MOVE_LEFT, MOVE_RIGHT, ROTATE
+from bitboard import BitboardGrid
+from game import Game
+from utilities import NUM_COLS, NUM_ROWS
+
+# Per game int64 result fields kept in shared memory, followed by every game's final board as one byte per cell
+FIELDS = ("score", "lines", "pieces", "actions", "game_over", "nanoseconds")
+
+GameResult = namedtuple("GameResult", ["seed", "score", "lines", "pieces", "actions", "game_over", "seconds",
+                                       "board"])
+
+_worker = {}
+
+
+def _attach(name, policy, seeds, max_actions, num_rows, num_cols):
+    _worker["shared"] = shared_memory.SharedMemory(name=name)
+    _worker["policy"] = policy
+    _worker["seeds"] = seeds
+    _worker["max_actions"] = max_actions
+    _worker["num_rows"] = num_rows
+    _worker["num_cols"] = num_cols
+
+
+def _play(index):
+    policy = _worker["policy"]
+    num_rows = _worker["num_rows"]
+    num_cols = _worker["num_cols"]
+    game = Game(headless=True, seed=_worker["seeds"][index], grid=BitboardGrid(num_rows, num_cols))
+    actions = 0
+    start = time.perf_counter_ns()
+    while not game.game_over and actions < _worker["max_actions"]:
+        game.apply_action(policy(game))
+        actions += 1
+    elapsed = time.perf_counter_ns() - start
+
+    buffer = _worker["shared"].buf
+    results = buffer[:len(_worker["seeds"]) * len(FIELDS) * 8].cast("q")
+    fields = (game.score, game.lines_cleared, game.pieces_placed, actions, game.game_over, elapsed)
+    for field, value in enumerate(fields):
+        results[index * len(FIELDS) + field] = value
+    results.release()
+    board_size = num_rows * num_cols
+    board_start = len(_worker["seeds"]) * len(FIELDS) * 8 + index * board_size
+    buffer[board_start:board_start + board_size] = b"".join(bytes(row) for row in game.grid.cells)
+    return index
+
+
+def run_games(policy, seeds, processes=None, max_actions=100000, num_rows=NUM_ROWS, num_cols=NUM_COLS):
+    # Plays one headless game per seed across a process pool on num_rows x num_cols boards. policy(game) returns
+    # the next action for a game; workers write results and final boards (num_rows * num_cols bytes, row by row)
+    # straight into shared memory, so no Game object is ever pickled
+    seeds = list(seeds)
+    results_size = len(seeds) * len(FIELDS) * 8
+    board_size = num_rows * num_cols
+    shared = shared_memory.SharedMemory(create=True, size=max(1, results_size + len(seeds) * board_size))
+    try:
+        processes = processes or os.cpu_count()
+        chunk_size = max(1, len(seeds) // (processes * 4))
+        arguments = (shared.name, policy, seeds, max_actions, num_rows, num_cols)
+        with multiprocessing.Pool(processes, _attach, arguments) as pool:
+            for _ in pool.imap_unordered(_play, range(len(seeds)), chunk_size):
+                pass
+
+        values = shared.buf[:results_size].cast("q")
+        results = []
+        for index, seed in enumerate(seeds):
+            score, lines, pieces, actions, game_over, nanoseconds = values[index * len(FIELDS):
+                                                                            (index + 1) * len(FIELDS)]
+            board_start = results_size + index * board_size
+            board = bytes(shared.buf[board_start:board_start + board_size])
+            results.append(GameResult(seed, score, lines, pieces, actions, bool(game_over), nanoseconds / 1e9,
+                                      board))
+        values.release()
+        return results
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+def summarize(results):
+    seconds = sum(result.seconds for result in results)
+    pieces = sum(result.pieces for result in results)
+    return {
+        "games": len(results),
+        "mean_score": sum(result.score for result in results) / max(1, len(results)),
+        "max_score": max((result.score for result in results), default=0),
+        "mean_lines": sum(result.lines for result in results) / max(1, len(results)),
+        "pieces_per_second": pieces / seconds if seconds else 0.0,
+        "game_over_rate": sum(result.game_over for result in results) / max(1, len(results)),
+    }
+
+
+def random_policy(game):
+    return random.choice((MOVE_LEFT, MOVE_RIGHT, ROTATE, GRAVITY, HARD_DROP, HOLD))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    start = time.perf_counter()
+    summary = summarize(run_games(random_policy, range(count)))
+    summary["wall_seconds"] = time.perf_counter() - start
+    for key, value in summary.items():
+        print(f"{key}: {value}")
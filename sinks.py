@@ -0,0 +1,10 @@
+class NullSounds:
+    # Sound sink used in headless mode, every effect is silently dropped
+    def play(self, name):
+        pass
+
+
+class NullRenderer:
+    # Draw sink used in headless mode, nothing is drawn
+    def draw_game(self, screen, game, paused=False, game_over=False, piece_offset=0):
+        pass
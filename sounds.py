@@ -0,0 +1,17 @@
+import assets
+
+
+class PygameSounds:
+    files = {
+        "rotate": "rotate.wav",
+        "clear": "clear.wav",
+    }
+
+    def __init__(self):
+        # Shared with every other game through the asset cache, and None for each sound when there is no audio
+        self.sounds = {name: assets.sound(file_name) for name, file_name in self.files.items()}
+
+    def play(self, name):
+        sound = self.sounds[name]
+        if sound is not None:
+            sound.play()
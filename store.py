@@ -0,0 +1,190 @@
+import argparse
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+DATABASE = "scores.db"
+BATCH_SIZE = 256  # records written in one transaction at most
+
+# Leaderboards walk games_by_score from the top and stop after their limit, session queries only read the rows of
+# that session through games_by_session, so neither slows down as games pile up. Replays live in their own table
+# to keep the rows those indexes point at small
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    session INTEGER NOT NULL REFERENCES sessions (id),
+    played_at REAL NOT NULL,
+    seed INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    pieces INTEGER NOT NULL,
+    tetrises INTEGER NOT NULL,
+    max_combo INTEGER NOT NULL,
+    seconds REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_by_score ON games (score DESC, id);
+CREATE INDEX IF NOT EXISTS games_by_session ON games (session, score DESC);
+CREATE TABLE IF NOT EXISTS replays (
+    game_id INTEGER PRIMARY KEY REFERENCES games (id),
+    data BLOB NOT NULL
+);
+"""
+INSERT_GAME = ("INSERT INTO games (session, played_at, seed, score, lines, pieces, tetrises, max_combo, seconds) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+INSERT_REPLAY = "INSERT INTO replays (game_id, data) VALUES (?, ?)"
+LEADERBOARD_COLUMNS = "id, session, played_at, score, lines, pieces, seconds"
+
+
+class GameRecord(namedtuple("GameRecord", ["session", "played_at", "seed", "score", "lines", "pieces", "tetrises",
+                                           "max_combo", "seconds", "replay"])):
+    __slots__ = ()
+
+    @property
+    def pps(self):
+        return pieces_per_second(self.pieces, self.seconds)
+
+
+class LeaderboardEntry(namedtuple("LeaderboardEntry", ["game_id", "session", "played_at", "score", "lines",
+                                                       "pieces", "seconds"])):
+    __slots__ = ()
+
+    @property
+    def pps(self):
+        return pieces_per_second(self.pieces, self.seconds)
+
+
+class SessionStats(namedtuple("SessionStats", ["games", "best_score", "average_score", "lines", "pieces", "tetrises",
+                                               "max_combo", "seconds"])):
+    __slots__ = ()
+
+    @property
+    def pps(self):
+        return pieces_per_second(self.pieces, self.seconds)
+
+
+def pieces_per_second(pieces, seconds):
+    return pieces / seconds if seconds > 0 else 0.0
+
+
+def connect(path):
+    # Write-ahead logging lets the queries of the game thread run while the writer thread commits
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def leaderboard(connection, limit=10, session=None):
+    if session is None:
+        rows = connection.execute(f"SELECT {LEADERBOARD_COLUMNS} FROM games ORDER BY score DESC, id LIMIT ?",
+                                  (limit,))
+    else:
+        rows = connection.execute(f"SELECT {LEADERBOARD_COLUMNS} FROM games WHERE session = ? "
+                                  f"ORDER BY score DESC LIMIT ?", (session, limit))
+    return [LeaderboardEntry(*row) for row in rows]
+
+
+def stored_replay(connection, game_id):
+    row = connection.execute("SELECT data FROM replays WHERE game_id = ?", (game_id,)).fetchone()
+    return row[0] if row is not None else None
+
+
+class ScoreStore:
+    # Finished games in a SQLite database. record() only queues the result, a background thread writes queued
+    # results in batches of up to BATCH_SIZE per transaction, so the game loop never waits on the disk. Queries run
+    # on the calling thread's own connection and only see results the writer has committed, flush() waits for that
+    def __init__(self, path=DATABASE):
+        self.path = path
+        self.connection = connect(path)
+        self.connection.executescript(SCHEMA)
+        with self.connection:
+            self.session = self.connection.execute("INSERT INTO sessions (started_at) VALUES (?)",
+                                                   (time.time(),)).lastrowid
+        self.failed = 0  # records lost to database errors
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name="score-store", daemon=True)
+        self.writer.start()
+
+    def record(self, game, seconds, replay=None):
+        # seconds is the game time played, replay the finished replay bytes if there are any
+        self.queue.put(GameRecord(self.session, time.time(), game.seed, game.score, game.lines_cleared,
+                                  game.pieces_placed, game.tetrises, game.max_combo, seconds, replay))
+
+    def write_loop(self):
+        connection = connect(self.path)
+        closing = False
+        while not closing:
+            batch = [self.queue.get()]
+            # Whatever else is already waiting goes into the same transaction
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            closing = len(records) < len(batch)
+            try:
+                with connection:
+                    for record in records:
+                        game_id = connection.execute(INSERT_GAME, record[:-1]).lastrowid
+                        if record.replay is not None:
+                            connection.execute(INSERT_REPLAY, (game_id, record.replay))
+            except sqlite3.Error:
+                self.failed += len(records)
+            for _ in batch:
+                self.queue.task_done()
+        connection.close()
+
+    def flush(self):
+        self.queue.join()
+
+    def close(self):
+        # Writes everything still queued before closing
+        self.queue.put(None)
+        self.writer.join()
+        self.connection.close()
+
+    def leaderboard(self, limit=10, session=None):
+        return leaderboard(self.connection, limit, session)
+
+    def best_score(self, session=None):
+        best = self.leaderboard(1, session)
+        return best[0].score if best else 0
+
+    def session_stats(self, session=None):
+        # Totals of one session, by default the current one
+        row = self.connection.execute(
+            "SELECT COUNT(*), MAX(score), AVG(score), SUM(lines), SUM(pieces), SUM(tetrises), MAX(max_combo), "
+            "SUM(seconds) FROM games WHERE session = ?", (self.session if session is None else session,)).fetchone()
+        return SessionStats(row[0], row[1] or 0, row[2] or 0.0, *(value or 0 for value in row[3:]))
+
+    def replay(self, game_id):
+        return stored_replay(self.connection, game_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the leaderboard or export a stored replay.")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--export", nargs=2, metavar=("GAME_ID", "PATH"), help="write a game's replay to a file")
+    arguments = parser.parse_args()
+
+    connection = connect(arguments.database)
+    connection.executescript(SCHEMA)
+    if arguments.export:
+        data = stored_replay(connection, int(arguments.export[0]))
+        if data is None:
+            parser.exit(1, f"No replay stored for game {arguments.export[0]}\n")
+        with open(arguments.export[1], "wb") as replay_file:
+            replay_file.write(data)
+    else:
+        for place, entry in enumerate(leaderboard(connection, arguments.limit), 1):
+            played_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.played_at))
+            print(f"{place:>3}. {entry.score:>9} {entry.lines:>5} lines {entry.pps:5.2f} pps  {played_at}  "
+                  f"game {entry.game_id}")
@@ -0,0 +1,73 @@
+import random
+from actions import ACTION_NAMES
+from bitboard import BitboardGrid
+from game import Game
+from utilities import *
+
+# Every action a player or the timer can take, NONE left out
+ACTIONS = tuple(range(1, len(ACTION_NAMES)))
+SIZES = ((NUM_ROWS, NUM_COLS), (12, 6), (30, 16))
+
+
+def assert_same_grid(grid, bitboard):
+    assert bitboard.cells == grid.cells
+    for row in range(grid.num_rows):
+        for column in range(grid.num_cols):
+            assert bitboard.is_empty_cell(row, column) == grid.is_empty_cell(row, column)
+
+
+def test_games_match():
+    # The same seeded games on a Grid and a BitboardGrid, driven by the same random actions, stay identical
+    for num_rows, num_cols in SIZES:
+        for seed in range(200 if num_cols == NUM_COLS else 40):
+            games = [Game(headless=True, seed=seed, grid=grid(num_rows, num_cols)) for grid in (Grid, BitboardGrid)]
+            policy = random.Random(seed)
+            for _ in range(2000):
+                action = policy.choice(ACTIONS)
+                for game in games:
+                    game.apply_action(action)
+                grid_game, bitboard_game = games
+                assert_same_grid(grid_game.grid, bitboard_game.grid)
+                assert bitboard_game.score == grid_game.score
+                assert bitboard_game.lines_cleared == grid_game.lines_cleared
+                assert bitboard_game.game_over == grid_game.game_over
+                if grid_game.game_over:
+                    break
+
+
+def test_fits_at_matches():
+    # fits_at for every block, rotation and position around random boards, including positions off the board
+    rng = random.Random(0)
+    for num_rows, num_cols in SIZES:
+        for _ in range(20):
+            cells = [[rng.choice((0, 0, 0, 1)) for _ in range(num_cols)] for _ in range(num_rows)]
+            grid = Grid(num_rows, num_cols)
+            bitboard = BitboardGrid(num_rows, num_cols)
+            grid.load_cells(cells)
+            bitboard.load_cells(cells)
+            assert_same_grid(grid, bitboard)
+            for block_id, rotations in SHAPES.items():
+                for rotation in range(len(rotations)):
+                    for row in range(-3, num_rows + 1):
+                        for column in range(-3, num_cols + 1):
+                            assert bitboard.fits_at(block_id, rotation, row, column) == \
+                                grid.fits_at(block_id, rotation, row, column)
+
+
+def test_clear_full_rows_matches():
+    # Random boards with some rows filled in, cleared on both grids
+    rng = random.Random(1)
+    for num_rows, num_cols in SIZES:
+        for _ in range(200):
+            cells = []
+            for _ in range(num_rows):
+                if rng.random() < 0.3:
+                    cells.append([rng.randint(1, 7) for _ in range(num_cols)])
+                else:
+                    cells.append([rng.choice((0, 0, rng.randint(1, 7))) for _ in range(num_cols)])
+            grid = Grid(num_rows, num_cols)
+            bitboard = BitboardGrid(num_rows, num_cols)
+            grid.load_cells(cells)
+            bitboard.load_cells(cells)
+            assert bitboard.clear_full_rows() == grid.clear_full_rows()
+            assert_same_grid(grid, bitboard)
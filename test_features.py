@@ -0,0 +1,46 @@
+import random
+from features import FeatureGrid, batch_features, board_features, mask_boards
+from game import Game
+from placements import game_placements
+from utilities import *
+
+SIZES = ((NUM_ROWS, NUM_COLS), (12, 6), (30, 16))
+
+
+def assert_same_features(grid):
+    # The features FeatureGrid keeps up to date, counted again from the rows and counted again in a batch of one
+    features = grid.features()
+    assert board_features(grid.rows, grid.full_row) == features
+    batch = batch_features(mask_boards([grid.rows], grid.full_row))
+    assert tuple(batch.heights[0]) == features.heights
+    assert batch.aggregate_height[0] == features.aggregate_height
+    assert batch.holes[0] == features.holes
+    assert batch.bumpiness[0] == features.bumpiness
+    assert batch.row_transitions[0] == features.row_transitions
+    assert tuple(batch.wells[0]) == features.wells
+
+
+def test_games_match():
+    # Seeded games placing random placements, line clears first, with garbage coming in now and then. The grid is
+    # checked after every action, the boards of all placements of a turn in one batch
+    for num_rows, num_cols in SIZES:
+        for seed in range(30 if num_cols == NUM_COLS else 10):
+            game = Game(headless=True, seed=seed, grid=FeatureGrid(num_rows, num_cols))
+            policy = random.Random(seed)
+            for _ in range(60):
+                current, _ = game_placements(game)
+                if game.game_over or not current:
+                    break
+                if policy.random() < 0.15:
+                    game.garbage_in += policy.randint(1, 3)
+                batch = batch_features(mask_boards([placement.rows for placement in current], game.grid.full_row))
+                for index, placement in enumerate(current):
+                    features = placement.features
+                    assert tuple(batch.heights[index]) == features.heights
+                    assert batch.holes[index] == features.holes
+                    assert batch.row_transitions[index] == features.row_transitions
+                    assert tuple(batch.wells[index]) == features.wells
+                clearing = [placement for placement in current if placement.lines_cleared]
+                for action in policy.choice(clearing or current).actions:
+                    game.apply_action(action)
+                    assert_same_features(game.grid)
@@ -0,0 +1,72 @@
+import random
+from actions import HOLD
+from bitboard import BitboardGrid
+from game import Game
+from placements import game_placements
+from rotation import kick
+from utilities import *
+
+
+def brute_force(grid, block_id, start):
+    # Cells of every resting position reachable from start, one position at a time with the moves of Game
+    def cells(rotation, row, column):
+        return frozenset((row + cell.row, column + cell.column) for cell in SHAPES[block_id][rotation])
+
+    seen = {start}
+    queue = [start] if grid.fits_at(block_id, *start) else []
+    resting = set()
+    for rotation, row, column in queue:
+        moves = [(rotation, row, column - 1), (rotation, row, column + 1), (rotation, row + 1, column)]
+        for turns in range(1, len(SHAPES[block_id])):
+            rotated = kick(grid.fits_at, block_id, rotation, row, column, turns)
+            if rotated is not None:
+                moves.append(rotated)
+        for move in moves:
+            if move not in seen and grid.fits_at(block_id, *move):
+                seen.add(move)
+                queue.append(move)
+        if not grid.fits_at(block_id, rotation, row + 1, column):
+            resting.add(cells(rotation, row, column))
+    return resting
+
+
+def check_game(seed, num_rows, num_cols, turns):
+    # Plays a seeded game placing random placements and checks the placements of every turn
+    game = Game(headless=True, seed=seed, grid=BitboardGrid(num_rows, num_cols))
+    policy = random.Random(seed)
+    for _ in range(turns):
+        if game.game_over:
+            break
+        current, held = game_placements(game)
+        block = game.current_block
+        start = (block.rotation_state, block.row_offset, block.column_offset)
+        found = [frozenset(placement.cells) for placement in current]
+        assert len(set(found)) == len(found)
+        assert set(found) == brute_force(game.grid, block.id, start)
+
+        # Playing out the actions of a placement has to give its board, checked for a few of them every turn
+        for placements, hold in ((current, False), (held, True)):
+            for placement in policy.sample(placements, min(len(placements), 8)):
+                played = game.clone()
+                if hold:
+                    played.apply_action(HOLD)
+                for action in placement.actions:
+                    played.apply_action(action)
+                assert tuple(played.grid.rows) == placement.rows
+                assert played.lines_cleared - game.lines_cleared == placement.lines_cleared
+        if not current:
+            break
+        for action in policy.choice(current).actions:
+            game.apply_action(action)
+
+
+def test_standard_board():
+    for seed in range(20):
+        check_game(seed, NUM_ROWS, NUM_COLS, 30)
+
+
+def test_other_board_sizes():
+    for seed in range(5):
+        check_game(seed, 12, 6, 20)
+    for seed in range(3):
+        check_game(seed, 30, 16, 15)
@@ -0,0 +1,88 @@
+import random
+from actions import GRAVITY, HARD_DROP, HOLD, MOVE_LEFT, MOVE_RIGHT, ROTATE, ROTATE_CCW, SOFT_DROP
+from bitboard import BitboardGrid
+from game import Game
+from replay import ReplayRecorder, encode_varint, read_replay, verify_replay, MAGIC, VERSION
+from timing import TICK_MS, FixedStepScheduler
+
+# Hard drops and holds are rare so most blocks fall and lock by gravity
+PLAYER_ACTIONS = (MOVE_LEFT, MOVE_RIGHT, ROTATE, ROTATE_CCW, SOFT_DROP) * 4 + (HARD_DROP, HOLD)
+
+
+class RandomInputs:
+    # Presses a random key now and then, the way controls.InputHandler feeds the scheduler
+    def __init__(self, rng):
+        self.rng = rng
+
+    def reset(self):
+        pass
+
+    def poll(self, tick, gravity_ms):
+        pass
+
+    def feed(self, game, apply):
+        if self.rng.random() < 0.1 and not game.game_over:
+            apply(self.rng.choice(PLAYER_ACTIONS))
+
+
+def record_game(seed, num_rows=20, num_cols=10, frames=20000):
+    # Plays a game as main.py does, frames of random length with actions both between and during ticks
+    game = Game(headless=True, seed=seed, grid=BitboardGrid(num_rows, num_cols))
+    recorder = ReplayRecorder(seed, num_rows=num_rows, num_cols=num_cols)
+    rng = random.Random(seed)
+
+    def apply(action):
+        recorder.record(scheduler.action_tick, action)
+        game.apply_action(action)
+
+    scheduler = FixedStepScheduler(game, apply, inputs=RandomInputs(rng))
+    for _ in range(frames):
+        if game.game_over:
+            break
+        scheduler.advance(rng.choice((0, TICK_MS / 2, TICK_MS, 3 * TICK_MS)))
+    return recorder.finish(game)
+
+
+def rewrite(data, edit):
+    # The replay with its (tick, action) list changed by edit, the recorded score and board hash left as they are
+    seed, (num_rows, num_cols), actions, score, expected_board_hash = read_replay(data)
+    actions = edit(list(actions))
+    encoded = bytearray(MAGIC + bytes([VERSION]) + encode_varint(seed) + encode_varint(num_rows) +
+                        encode_varint(num_cols))
+    last_tick = 0
+    for tick, action in actions:
+        encoded += encode_varint((tick - last_tick) << 4 | action)
+        last_tick = tick
+    return bytes(encoded + encode_varint(0) + encode_varint(score) + expected_board_hash)
+
+
+def test_recorded_games_verify():
+    for seed in range(10):
+        data = record_game(seed)
+        assert rewrite(data, lambda actions: actions) == data
+        assert verify_replay(data)
+    assert verify_replay(record_game(0, 12, 6))
+
+
+def test_tampered_gravity_is_rejected():
+    for seed in range(5):
+        data = record_game(seed)
+        actions = read_replay(data)[2]
+        gravity = [index for index, (tick, action) in enumerate(actions) if action == GRAVITY]
+        drops = [index for index, (tick, action) in enumerate(actions) if action == SOFT_DROP]
+        # A drop taken out, one added, or one moved to another tick
+        index = gravity[len(gravity) // 2]
+        assert not verify_replay(rewrite(data, lambda actions: actions[:index] + actions[index + 1:]))
+        assert not verify_replay(rewrite(data, lambda actions: actions[:index] + [actions[index]] + actions[index:]))
+        tick = actions[index][0]
+        assert not verify_replay(rewrite(data, lambda actions: actions[:index] + [(tick + 1, GRAVITY)] +
+                                         [(max(t, tick + 1), a) for t, a in actions[index + 1:]]))
+        # A soft drop passed off as gravity still gives the same board, only the timing gives it away
+        index = drops[len(drops) // 2]
+        assert not verify_replay(rewrite(data, lambda actions: actions[:index] + [(actions[index][0], GRAVITY)] +
+                                         actions[index + 1:]))
+
+
+def test_cut_short_replay_is_rejected():
+    data = record_game(0)
+    assert not verify_replay(rewrite(data, lambda actions: actions[:len(actions) // 2]))
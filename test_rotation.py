@@ -0,0 +1,59 @@
+from rotation import I_BLOCK, KICKS, kick
+from utilities import *
+
+T_BLOCK = 6
+O_BLOCK = 4
+
+
+def board(filled=()):
+    grid = Grid()
+    for row, column in filled:
+        grid.cells[row][column] = 1
+    return grid
+
+
+def test_tables_turn_guideline_offsets_into_rows_and_columns():
+    # (x, y) with y up becomes (row, column) = (-y, x), the first offset of every kick staying in place
+    assert KICKS[T_BLOCK][0][1] == ((0, 0), (0, -1), (-1, -1), (2, 0), (2, -1))
+    assert KICKS[T_BLOCK][1][3] == ((0, 0), (0, 1), (1, 1), (-2, 0), (-2, 1))
+    assert KICKS[I_BLOCK][0][1] == ((0, 0), (0, -2), (0, 1), (1, -2), (-2, 1))
+    assert KICKS[I_BLOCK][3][1] == ((0, 0), (0, 1), (0, -2), (2, 1), (-1, -2))
+    assert KICKS[T_BLOCK][0][2] == ((0, 0), (-1, 0), (-1, 1), (-1, -1), (0, 1), (0, -1))
+    assert KICKS[O_BLOCK][0] == (((0, 0),),) * 4
+
+
+def test_wall_kicks():
+    # T upright against the left wall turning back flat has to step right, the second JLSTZ test
+    grid = board()
+    assert kick(grid.fits_at, T_BLOCK, 1, 5, -1, 3) == (0, 5, 0)
+    # Same for an upright I turning flat, the second I test
+    assert kick(grid.fits_at, I_BLOCK, 3, 5, -1, 1) == (0, 5, 0)
+    # Against the right wall turning counter clockwise it moves two columns left, the second test
+    assert kick(grid.fits_at, I_BLOCK, 3, 5, 8, 3) == (2, 5, 6)
+    # Against the left wall turning clockwise a step left is no good either, the third test moves it two right
+    assert kick(grid.fits_at, I_BLOCK, 1, 5, -2, 1) == (2, 5, 0)
+
+
+def test_floor_kicks():
+    # A flat T on the floor turning upright would end below it, the third test lifts it one row and one column left
+    grid = board()
+    assert kick(grid.fits_at, T_BLOCK, 0, NUM_ROWS - 2, 3, 1) == (1, NUM_ROWS - 3, 2)
+    # A half turn on the floor lifts it one row, the second 180 test
+    assert kick(grid.fits_at, T_BLOCK, 0, NUM_ROWS - 2, 3, 2) == (2, NUM_ROWS - 3, 3)
+
+
+def test_t_spin_triple():
+    # The bottom three rows are full but for the cells of an upright T, under an overhang at (NUM_ROWS - 5, 3).
+    # A flat T above turning clockwise fails the first four tests and drops in with the fifth, two rows down and
+    # one column left, clearing all three rows
+    bottom = NUM_ROWS - 3
+    slot = {(bottom, 3), (bottom + 1, 3), (bottom + 1, 4), (bottom + 2, 3)}
+    filled = [(row, column) for row in range(bottom, NUM_ROWS) for column in range(NUM_COLS)
+              if (row, column) not in slot]
+    grid = board(filled + [(bottom - 2, 3)])
+    rotated = kick(grid.fits_at, T_BLOCK, 0, bottom - 2, 3, 1)
+    assert rotated == (1, bottom, 2)
+    block = block_from_state((T_BLOCK,) + rotated)
+    assert {tuple(cell) for cell in block.get_cell_positions()} == slot
+    grid.place(block)
+    assert grid.clear_full_rows() == 3
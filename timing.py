@@ -0,0 +1,149 @@
+from collections import namedtuple
+from actions import GRAVITY
+
+TICK_MS = 1000 / 60  # length of one logic tick
+MAX_TICKS_PER_FRAME = 10  # ticks caught up in one frame before the backlog is dropped
+FAST_FORWARD_SCALE = 8  # game time run per real time in fast-forward
+LINES_PER_LEVEL = 10
+
+# Milliseconds between gravity drops and before a grounded block locks, from level 0 up. Levels past the end of
+# the table keep its last speed. Level 0 falls at the old fixed 400 ms timer
+LevelSpeed = namedtuple("LevelSpeed", ["gravity", "lock_delay"])
+SPEEDS = (
+    LevelSpeed(400, 500), LevelSpeed(350, 500), LevelSpeed(300, 500), LevelSpeed(250, 500), LevelSpeed(200, 500),
+    LevelSpeed(160, 500), LevelSpeed(130, 500), LevelSpeed(100, 500), LevelSpeed(80, 450), LevelSpeed(65, 450),
+    LevelSpeed(50, 400), LevelSpeed(40, 400), LevelSpeed(33, 350), LevelSpeed(25, 300), LevelSpeed(17, 250),
+)
+
+
+class FixedStepScheduler:
+    # Runs game logic in fixed TICK_MS steps however long rendered frames take. Real time goes into an accumulator
+    # that is drained one tick at a time, and every action a tick produces goes through apply (by default the
+    # game's own apply_action) so callers can record it. Gravity drops the block every speed.gravity ms of game
+    # time; a grounded block only locks after lying still for speed.lock_delay ms. Player input comes from an
+    # optional controls.InputHandler, polled every tick before gravity
+    def __init__(self, game, apply=None, start_level=0, speeds=SPEEDS, tick_ms=TICK_MS, inputs=None):
+        self.game = game
+        self.apply = apply if apply is not None else game.apply_action
+        self.inputs = inputs
+        self.start_level = start_level
+        self.speeds = speeds
+        self.tick_ms = tick_ms
+        self.fast_forward = False
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        if self.inputs is not None:
+            self.inputs.reset()
+        self.block_key = None
+        self.stepping = False
+        self.accumulator = 0.0
+        self.gravity_timer = 0.0
+        self.lock_timer = 0.0
+
+    @property
+    def level(self):
+        return self.start_level + self.game.lines_cleared // LINES_PER_LEVEL
+
+    @property
+    def speed(self):
+        return self.speeds[min(self.level, len(self.speeds) - 1)]
+
+    @property
+    def alpha(self):
+        # How far real time is into the next tick, from 0 up to 1, for drawing between ticks
+        return self.accumulator / self.tick_ms
+
+    @property
+    def fall_progress(self):
+        # How far the falling block is on its way to the next row, from 0 up to 1. Always 0 once it is grounded
+        if self.current_block_key() != self.block_key or self.game.game_over or self.game.is_grounded():
+            return 0.0
+        return min(1.0, (self.gravity_timer + self.alpha * self.tick_ms) / self.speed.gravity)
+
+    @property
+    def action_tick(self):
+        # The tick an action applied right now belongs to: the one running, or between ticks the next one, since the
+        # action comes before that tick's gravity. Replays record actions at this tick to be played back in order
+        return self.ticks if self.stepping else self.ticks + 1
+
+    def current_block_key(self):
+        # Changes whenever a new block comes in, by locking or by a hold. Plain values rather than the block
+        # object, which a restored game replaces
+        return self.game.pieces_placed, self.game.hold_swapped_this_drop
+
+    def snapshot(self):
+        return self.ticks, self.block_key, self.accumulator, self.gravity_timer, self.lock_timer
+
+    def restore(self, snapshot):
+        self.ticks, self.block_key, self.accumulator, self.gravity_timer, self.lock_timer = snapshot
+
+    def advance(self, elapsed_ms):
+        # Runs the ticks that fit into elapsed_ms of real time and returns how many ran. Normally at most
+        # MAX_TICKS_PER_FRAME run and any larger backlog (a stall, a dragged window) is dropped; in fast-forward
+        # time runs FAST_FORWARD_SCALE times faster and every tick due is run
+        # Keys pressed since the last frame are applied right away rather than on the next tick
+        if self.inputs is not None:
+            self.inputs.feed(self.game, self.apply)
+        if self.fast_forward:
+            self.accumulator += elapsed_ms * FAST_FORWARD_SCALE
+            limit = None
+        else:
+            self.accumulator += elapsed_ms
+            limit = MAX_TICKS_PER_FRAME
+        ticks = 0
+        while self.accumulator >= self.tick_ms and (limit is None or ticks < limit):
+            self.accumulator -= self.tick_ms
+            self.step()
+            ticks += 1
+        if limit is not None and ticks == limit:
+            self.accumulator = min(self.accumulator, self.tick_ms)
+        return ticks
+
+    def run(self, ticks):
+        # Runs a number of ticks straight away, for replays and demos that do not follow real time
+        for _ in range(ticks):
+            if self.game.game_over:
+                break
+            self.step()
+
+    def step(self):
+        self.ticks += 1
+        self.stepping = True
+        try:
+            self.run_tick()
+        finally:
+            self.stepping = False
+
+    def run_tick(self):
+        if self.game.game_over:
+            return
+        if self.inputs is not None:
+            self.inputs.poll(self.ticks, self.speed.gravity)
+            self.inputs.feed(self.game, self.apply)
+            if self.game.game_over:
+                return
+        # Every new block starts with fresh gravity and lock timers
+        block_key = self.current_block_key()
+        if block_key != self.block_key:
+            self.block_key = block_key
+            self.gravity_timer = 0.0
+            self.lock_timer = 0.0
+        speed = self.speed
+        if self.game.is_grounded():
+            self.gravity_timer = 0.0
+            self.lock_timer += self.tick_ms
+            if self.lock_timer >= speed.lock_delay:
+                self.lock_timer = 0.0
+                self.apply(GRAVITY)
+            return
+        self.lock_timer = 0.0
+        self.gravity_timer += self.tick_ms
+        # Fast levels can drop the block more than one row in a tick
+        while self.gravity_timer >= speed.gravity:
+            self.gravity_timer -= speed.gravity
+            self.apply(GRAVITY)
+            if self.game.game_over or self.game.is_grounded():
+                self.gravity_timer = 0.0
+                break
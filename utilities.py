@@ -1,4 +1,6 @@
-import pygame
+import copy
+from collections import namedtuple
+from functools import lru_cache
 
 class Colors:
     neon_purple = (155, 120, 250)
@@ -16,21 +18,49 @@ class Colors:
     purple = (203, 153, 255)
     cyan = (153, 255, 255)
     blue = (153, 204, 255)
+    silver = (190, 190, 200)
+
+    # Palettes indexed by block id (GARBAGE last), built once instead of on every lookup
+    block_colors = (darkest_gray, green, red, orange, yellow, purple, cyan, blue, silver)
+    block_grays = (darkest_gray, white, white, white, white, white, white, white, white)
 
     @classmethod
     def get_colors(cls):
-        return [cls.darkest_gray, cls.green, cls.red, cls.orange, cls.yellow, cls.purple, cls.cyan, cls.blue]
+        return cls.block_colors
 
     @classmethod
     def get_grays(cls):
-        return [cls.darkest_gray, cls.white, cls.white, cls.white, cls.white, cls.white, cls.white, cls.white]
+        return cls.block_grays
+
+
+GARBAGE = 8  # cell value of garbage rows sent by an opponent
+
+# Standard board, block constructors put blocks at their spawn on a board this wide
+NUM_ROWS = 20
+NUM_COLS = 10
+CELL_SIZE = 25
+MIN_SIZE = 4  # fewest rows and columns a board can have, every block has to fit in sideways and upright
+MAX_SIZE = 1000  # most rows and columns a board can have, also what a replay may ask the verifier for
+
+
+def spawn_shift(num_cols):
+    # Columns to move a newly built block by so it spawns in the middle of a board num_cols wide
+    return (num_cols - NUM_COLS) // 2
 
 
 class Grid:
-    def __init__(self):
-        self.num_rows = 20
-        self.num_cols = 10
-        self.cell_size = 25
+    # Rows of cells are replaced rather than written to, so a row list never changes once it is in the grid and
+    # snapshots and renderers can keep the rows they have seen. cell_size is only used for drawing
+    def __init__(self, num_rows=NUM_ROWS, num_cols=NUM_COLS, cell_size=CELL_SIZE):
+        if num_rows < MIN_SIZE or num_cols < MIN_SIZE:
+            raise ValueError(f"Boards need at least {MIN_SIZE} rows and columns, got {num_rows}x{num_cols}")
+        if num_rows > MAX_SIZE or num_cols > MAX_SIZE:
+            raise ValueError(f"Boards can have at most {MAX_SIZE} rows and columns, got {num_rows}x{num_cols}")
+        if cell_size < 1:
+            raise ValueError(f"Cells need to be at least 1 pixel, got {cell_size}")
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.cell_size = cell_size
         self.cells = [[0 for _ in range(self.num_cols)] for _ in range(self.num_rows)]
 
     def print_cells(self):
@@ -45,41 +75,119 @@ class Grid:
     def is_empty_cell(self, row, column):
         return self.cells[row][column] == 0
 
+    def fits(self, block):
+        for cell in block.get_cell_positions():
+            if not self.is_inside(cell.row, cell.column) or not self.is_empty_cell(cell.row, cell.column):
+                return False
+        return True
+
+    def fits_at(self, block_id, rotation, row, column):
+        # Same test as fits for a block that is not there, used to try rotations without moving anything
+        for cell in cell_positions(block_id, rotation, row, column):
+            if not self.is_inside(cell.row, cell.column) or not self.is_empty_cell(cell.row, cell.column):
+                return False
+        return True
+
+    def place(self, block):
+        copied = {}
+        for position in block.get_cell_positions():
+            row = copied.get(position.row)
+            if row is None:
+                row = copied[position.row] = self.cells[position.row][:]
+                self.cells[position.row] = row
+            row[position.column] = block.id
+
     def clear_full_rows(self):
-        rows_cleared = 0
-        for row in range(self.num_rows - 1, 0, -1):
-            if all(self.cells[row]):
-                for column in range(self.num_cols):
-                    self.cells[row][column] = 0
-                rows_cleared += 1
-            elif rows_cleared > 0:
-                for column in range(self.num_cols):
-                    self.cells[row + rows_cleared][column] = self.cells[row][column]
-                    self.cells[row][column] = 0
+        # Row 0 is never cleared or shifted. Rows move as whole lists instead of cell by cell
+        kept = [row for row in self.cells[1:] if not all(row)]
+        rows_cleared = self.num_rows - 1 - len(kept)
+        if rows_cleared > 0:
+            self.cells[1:] = [[0] * self.num_cols for _ in range(rows_cleared)] + kept
         return rows_cleared
 
     def reset_grid(self):
-        for row in range(self.num_rows):
-            for column in range(self.num_cols):
-                self.cells[row][column] = 0
+        self.cells[:] = [[0] * self.num_cols for _ in range(self.num_rows)]
 
-    def draw(self, screen, paused=False, game_over=False):
-        for row in range(self.num_rows):
-            for col in range(self.num_cols):
-                cell_value = self.cells[row][col]
-                cell_rect = pygame.Rect(col * self.cell_size + 190, row * self.cell_size + 11, self.cell_size - 4,
-                                        self.cell_size - 4)
-                if paused or game_over:
-                    pygame.draw.rect(screen, Colors.get_grays()[cell_value], cell_rect, 3)
-                else:
-                    pygame.draw.rect(screen, Colors.get_colors()[cell_value], cell_rect, 3)
+    def load_cells(self, cells):
+        self.cells = [list(row) for row in cells]
+
+    def add_garbage(self, lines, hole_column):
+        # Pushes the stack up by lines rows that are full but for hole_column. Returns False when occupied
+        # cells were pushed out over the top
+        lines = min(lines, self.num_rows)
+        overflow = any(any(row) for row in self.cells[:lines])
+        garbage = [GARBAGE] * self.num_cols
+        garbage[hole_column] = 0
+        self.cells = self.cells[lines:] + [garbage[:] for _ in range(lines)]
+        return not overflow
+
+    def snapshot(self):
+        return tuple(tuple(row) for row in self.cells)
+
+    def restore(self, snapshot):
+        self.cells = [list(row) for row in snapshot]
+
+    def copy(self):
+        grid = copy.copy(self)
+        grid.restore(self.snapshot())
+        return grid
+
+
+Coordinate = namedtuple("Coordinate", ["row", "column"])
+
+
+def _shape(*rotations):
+    return tuple(tuple(Coordinate(row, column) for row, column in cells) for cells in rotations)
+
+
+# Cell offsets for every rotation of each block id, shared by all blocks of that kind
+SHAPES = {
+    1: _shape(((0, 2), (1, 0), (1, 1), (1, 2)),
+              ((0, 1), (1, 1), (2, 1), (2, 2)),
+              ((1, 0), (1, 1), (1, 2), (2, 0)),
+              ((0, 0), (0, 1), (1, 1), (2, 1))),
+    2: _shape(((0, 0), (1, 0), (1, 1), (1, 2)),
+              ((0, 1), (0, 2), (1, 1), (2, 1)),
+              ((1, 0), (1, 1), (1, 2), (2, 2)),
+              ((0, 1), (1, 1), (2, 0), (2, 1))),
+    3: _shape(((1, 0), (1, 1), (1, 2), (1, 3)),
+              ((0, 2), (1, 2), (2, 2), (3, 2)),
+              ((2, 0), (2, 1), (2, 2), (2, 3)),
+              ((0, 1), (1, 1), (2, 1), (3, 1))),
+    4: _shape(((0, 0), (0, 1), (1, 0), (1, 1)),),
+    5: _shape(((0, 1), (0, 2), (1, 0), (1, 1)),
+              ((0, 1), (1, 1), (1, 2), (2, 2)),
+              ((1, 1), (1, 2), (2, 0), (2, 1)),
+              ((0, 0), (1, 0), (1, 1), (2, 1))),
+    6: _shape(((0, 1), (1, 0), (1, 1), (1, 2)),
+              ((0, 1), (1, 1), (1, 2), (2, 1)),
+              ((1, 0), (1, 1), (1, 2), (2, 1)),
+              ((0, 1), (1, 0), (1, 1), (2, 1))),
+    7: _shape(((0, 0), (0, 1), (1, 1), (1, 2)),
+              ((0, 2), (1, 1), (1, 2), (2, 1)),
+              ((1, 0), (1, 1), (2, 1), (2, 2)),
+              ((0, 1), (1, 0), (1, 1), (2, 0))),
+}
+
+
+POSITIONS_CACHE_SIZE = 4096  # placements whose cell positions are kept, the least recently used go first
+
+
+@lru_cache(maxsize=POSITIONS_CACHE_SIZE)
+def cell_positions(block_id, rotation_state, row_offset, column_offset):
+    # Positions are memoized per placement so moving, validating and drawing a block allocates nothing new. The
+    # memo is bounded for big boards, a block that has not moved still gets the very same tuple back
+    return tuple(Coordinate(cell.row + row_offset, cell.column + column_offset)
+                 for cell in SHAPES[block_id][rotation_state])
 
 
 class Block:
+    __slots__ = ("id", "row_offset", "column_offset", "rotation_state")
+    cells = ()
+    cell_size = 25
+
     def __init__(self, id):
         self.id = id
-        self.cells = {}
-        self.cell_size = 25
         self.row_offset = 0
         self.column_offset = 0
         self.rotation_state = 0
@@ -89,11 +197,7 @@ class Block:
         self.column_offset += columns
 
     def get_cell_positions(self):
-        moved_cell_positions = []
-        for cell_position in self.cells[self.rotation_state]:
-            cell_position = Coordinate(cell_position.row + self.row_offset, cell_position.column + self.column_offset)
-            moved_cell_positions.append(cell_position)
-        return moved_cell_positions
+        return cell_positions(self.id, self.rotation_state, self.row_offset, self.column_offset)
 
     def rotate(self):
         self.rotation_state += 1
@@ -109,93 +213,74 @@ class Block:
         self.row_offset = 0
         self.column_offset = 0
 
-    def draw(self, screen, offset_x, offset_y, paused=False, game_over=False):
-        cells = self.get_cell_positions()
-        for cell in cells:
-            cell_rect = pygame.Rect(offset_x + cell.column * self.cell_size, offset_y + cell.row * self.cell_size,
-                                    self.cell_size - 4, self.cell_size - 4)
-            if paused or game_over:
-                pygame.draw.rect(screen, Colors.get_grays()[self.id], cell_rect, 3)
-            else:
-                pygame.draw.rect(screen, Colors.get_colors()[self.id], cell_rect, 3)
-
-
-class Coordinate:
-    def __init__(self, row, column):
-        self.row = row
-        self.column = column
+    def state(self):
+        return self.id, self.rotation_state, self.row_offset, self.column_offset
 
 
 class LBlock(Block):
+    __slots__ = ()
+    cells = SHAPES[1]
+
     def __init__(self):
         super().__init__(id=1)
-        self.cells = {
-            0: [Coordinate(0, 2), Coordinate(1, 0), Coordinate(1, 1), Coordinate(1, 2)],
-            1: [Coordinate(0, 1), Coordinate(1, 1), Coordinate(2, 1), Coordinate(2, 2)],
-            2: [Coordinate(1, 0), Coordinate(1, 1), Coordinate(1, 2), Coordinate(2, 0)],
-            3: [Coordinate(0, 0), Coordinate(0, 1), Coordinate(1, 1), Coordinate(2, 1)]
-        }
         self.move(0, 3)  # initial spawn points on grid
 
 class JBlock(Block):
+    __slots__ = ()
+    cells = SHAPES[2]
+
     def __init__(self):
         super().__init__(id=2)
-        self.cells = {
-            0: [Coordinate(0, 0), Coordinate(1, 0), Coordinate(1, 1), Coordinate(1, 2)],
-            1: [Coordinate(0, 1), Coordinate(0, 2), Coordinate(1, 1), Coordinate(2, 1)],
-            2: [Coordinate(1, 0), Coordinate(1, 1), Coordinate(1, 2), Coordinate(2, 2)],
-            3: [Coordinate(0, 1), Coordinate(1, 1), Coordinate(2, 0), Coordinate(2, 1)]
-        }
         self.move(0, 3)
 
 class IBlock(Block):
+    __slots__ = ()
+    cells = SHAPES[3]
+
     def __init__(self):
         super().__init__(id=3)
-        self.cells = {
-            0: [Coordinate(1, 0), Coordinate(1, 1), Coordinate(1, 2), Coordinate(1, 3)],
-            1: [Coordinate(0, 2), Coordinate(1, 2), Coordinate(2, 2), Coordinate(3, 2)],
-            2: [Coordinate(2, 0), Coordinate(2, 1), Coordinate(2, 2), Coordinate(2, 3)],
-            3: [Coordinate(0, 1), Coordinate(1, 1), Coordinate(2, 1), Coordinate(3, 1)]
-        }
         self.move(-1, 3)
 
 class OBlock(Block):
+    __slots__ = ()
+    cells = SHAPES[4]
+
     def __init__(self):
         super().__init__(id=4)
-        self.cells = {
-            0: [Coordinate(0, 0), Coordinate(0, 1), Coordinate(1, 0), Coordinate(1, 1)]
-        }
         self.move(0, 4)
 
 class SBlock(Block):
+    __slots__ = ()
+    cells = SHAPES[5]
+
     def __init__(self):
         super().__init__(id=5)
-        self.cells = {
-            0: [Coordinate(0, 1), Coordinate(0, 2), Coordinate(1, 0), Coordinate(1, 1)],
-            1: [Coordinate(0, 1), Coordinate(1, 1), Coordinate(1, 2), Coordinate(2, 2)],
-            2: [Coordinate(1, 1), Coordinate(1, 2), Coordinate(2, 0), Coordinate(2, 1)],
-            3: [Coordinate(0, 0), Coordinate(1, 0), Coordinate(1, 1), Coordinate(2, 1)]
-        }
         self.move(0, 3)
 
 class TBlock(Block):
+    __slots__ = ()
+    cells = SHAPES[6]
+
     def __init__(self):
         super().__init__(id=6)
-        self.cells = {
-            0: [Coordinate(0, 1), Coordinate(1, 0), Coordinate(1, 1), Coordinate(1, 2)],
-            1: [Coordinate(0, 1), Coordinate(1, 1), Coordinate(1, 2), Coordinate(2, 1)],
-            2: [Coordinate(1, 0), Coordinate(1, 1), Coordinate(1, 2), Coordinate(2, 1)],
-            3: [Coordinate(0, 1), Coordinate(1, 0), Coordinate(1, 1), Coordinate(2, 1)]
-        }
         self.move(0, 3)
 
 class ZBlock(Block):
+    __slots__ = ()
+    cells = SHAPES[7]
+
     def __init__(self):
         super().__init__(id=7)
-        self.cells = {
-            0: [Coordinate(0, 0), Coordinate(0, 1), Coordinate(1, 1), Coordinate(1, 2)],
-            1: [Coordinate(0, 2), Coordinate(1, 1), Coordinate(1, 2), Coordinate(2, 1)],
-            2: [Coordinate(1, 0), Coordinate(1, 1), Coordinate(2, 1), Coordinate(2, 2)],
-            3: [Coordinate(0, 1), Coordinate(1, 0), Coordinate(1, 1), Coordinate(2, 0)]
-        }
         self.move(0, 3)
+
+
+BLOCK_TYPES = {block_type().id: block_type for block_type in (LBlock, JBlock, IBlock, OBlock, SBlock, TBlock, ZBlock)}
+
+
+def block_from_state(state):
+    block_id, rotation_state, row_offset, column_offset = state
+    block = BLOCK_TYPES[block_id]()
+    block.rotation_state = rotation_state
+    block.row_offset = row_offset
+    block.column_offset = column_offset
+    return block
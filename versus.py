@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from actions import ACTION_BITS, HARD_DROP, MOVE_LEFT, MOVE_RIGHT, NONE, ROTATE, SOFT_DROP
+from game import Game
+from replay import decode_varint, encode_varint
+from timing import TICK_MS, FixedStepScheduler
+
+# Every message is a varint length followed by a one byte type and its fields:
+#   JOIN   varint room
+#   START  player byte, varint seed
+#   INPUT  varint ticks confirmed since the last INPUT, then one varint per action holding
+#          (tick delta << ACTION_BITS | action) and END. Tick deltas count from the first unconfirmed tick
+#          and then from the previous action, so a tick without input costs nothing
+JOIN = 1
+START = 2
+INPUT = 3
+END = 0
+
+PORT = 7777
+MAX_ROLLBACK = 30  # ticks a client may run ahead of the opponent's confirmed input before it waits
+HEARTBEAT_TICKS = 4  # ticks without input before the confirmed tick is sent anyway
+MAX_MESSAGE = 1 << 16
+
+
+def frame(payload):
+    return encode_varint(len(payload)) + payload
+
+
+async def read_message(reader):
+    length = 0
+    shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    if length > MAX_MESSAGE:
+        raise ValueError(f"Message too long: {length} bytes")
+    return await reader.readexactly(length)
+
+
+def encode_inputs(previous_tick, last_tick, inputs):
+    # inputs are (tick, action) pairs in tick order for ticks previous_tick + 1 up to last_tick
+    encoded = bytearray([INPUT])
+    encoded += encode_varint(last_tick - previous_tick)
+    base = previous_tick + 1
+    for tick, action in inputs:
+        encoded += encode_varint((tick - base) << ACTION_BITS | action)
+        base = tick
+    encoded += encode_varint(END)
+    return bytes(encoded)
+
+
+def decode_inputs(message, previous_tick):
+    # Returns the new last confirmed tick and the (tick, action) pairs up to it
+    count, position = decode_varint(message, 1)
+    last_tick = previous_tick + count
+    base = previous_tick + 1
+    inputs = []
+    action_mask = (1 << ACTION_BITS) - 1
+    while True:
+        value, position = decode_varint(message, position)
+        if value == END:
+            break
+        base += value >> ACTION_BITS
+        inputs.append((base, value & action_mask))
+    return last_tick, inputs
+
+
+class Match:
+    # Two games dealt from the same seed and stepped together one tick at a time. Each player's actions for a
+    # tick go in before its gravity tick, and garbage sent during the tick is handed over at its end
+    def __init__(self, seed):
+        self.seed = seed
+        self.games = (Game(headless=True, seed=seed), Game(headless=True, seed=seed))
+        self.schedulers = tuple(FixedStepScheduler(game) for game in self.games)
+        self.tick = 0
+
+    def step(self, actions):
+        for game, scheduler, player_actions in zip(self.games, self.schedulers, actions):
+            for action in player_actions:
+                if not game.game_over:
+                    game.apply_action(action)
+            scheduler.step()
+        first, second = self.games
+        if first.garbage_out:
+            second.receive_garbage(first.garbage_out)
+            first.garbage_out = 0
+        if second.garbage_out:
+            first.receive_garbage(second.garbage_out)
+            second.garbage_out = 0
+        self.tick += 1
+
+    @property
+    def over(self):
+        return any(game.game_over for game in self.games)
+
+    @property
+    def winner(self):
+        # Index of the player still standing, None while both play or when both topped out on the same tick
+        standing = [player for player, game in enumerate(self.games) if not game.game_over]
+        return standing[0] if len(standing) == 1 else None
+
+    def snapshot(self):
+        return (self.tick, tuple(game.snapshot() for game in self.games),
+                tuple(scheduler.snapshot() for scheduler in self.schedulers))
+
+    def restore(self, snapshot):
+        self.tick, games, schedulers = snapshot
+        for game, game_snapshot in zip(self.games, games):
+            game.restore(game_snapshot)
+        for scheduler, scheduler_snapshot in zip(self.schedulers, schedulers):
+            scheduler.restore(scheduler_snapshot)
+
+    def checksum(self):
+        digest = hashlib.blake2b(digest_size=8)
+        for game in self.games:
+            digest.update(b"".join(bytes(row) for row in game.grid.cells))
+            digest.update(encode_varint(game.score) + encode_varint(game.pieces_placed))
+        digest.update(encode_varint(self.tick))
+        return digest.digest()
+
+
+class RollbackSession:
+    # One player's view of a match. Own input is applied straight away and the opponent is predicted to do
+    # nothing; when the opponent's real input for a past tick arrives the match goes back to the snapshot
+    # taken before that tick and is simulated forward again. Running more than max_rollback ticks ahead of
+    # the opponent's confirmed input is not allowed, which turns the session into plain lockstep on a slow link
+    def __init__(self, seed, player, max_rollback=MAX_ROLLBACK):
+        self.match = Match(seed)
+        self.player = player
+        self.opponent = 1 - player
+        self.max_rollback = max_rollback
+        self.inputs = ({}, {})  # per player, tick -> tuple of actions
+        self.pending = []
+        self.snapshots = {}
+        self.remote_confirmed = -1
+        self.sent_tick = -1
+        self.unsent = []
+        self.rollbacks = 0
+        self.rolled_back_ticks = 0
+
+    def can_advance(self):
+        return self.match.tick - self.remote_confirmed <= self.max_rollback
+
+    @property
+    def finished(self):
+        # Over on a tick whose input from both sides is confirmed, so no rollback can undo it
+        return self.match.over and self.match.tick - 1 <= self.remote_confirmed
+
+    def add_local(self, action):
+        if action != NONE:
+            self.pending.append(action)
+
+    def advance(self):
+        tick = self.match.tick
+        if self.pending:
+            self.inputs[self.player][tick] = tuple(self.pending)
+            self.unsent.extend((tick, action) for action in self.pending)
+            self.pending = []
+        if tick > self.remote_confirmed:
+            self.snapshots[tick] = self.match.snapshot()
+        self.match.step(self.actions_for(tick))
+
+    def actions_for(self, tick):
+        return self.inputs[0].get(tick, ()), self.inputs[1].get(tick, ())
+
+    def outgoing(self, force=False):
+        # INPUT message with everything not sent yet, or None when there is nothing worth sending
+        last_tick = self.match.tick - 1
+        if last_tick <= self.sent_tick or not (self.unsent or force or
+                                               last_tick - self.sent_tick >= HEARTBEAT_TICKS):
+            return None
+        message = encode_inputs(self.sent_tick, last_tick, self.unsent)
+        self.sent_tick = last_tick
+        self.unsent = []
+        return message
+
+    def receive(self, message):
+        last_tick, inputs = decode_inputs(message, self.remote_confirmed)
+        earliest = None
+        remote = self.inputs[self.opponent]
+        for tick, action in inputs:
+            remote[tick] = remote.get(tick, ()) + (action,)
+            if tick < self.match.tick and (earliest is None or tick < earliest):
+                earliest = tick
+        self.remote_confirmed = last_tick
+
+        if earliest is not None:
+            # Predicted no input at earliest, so everything from there on is simulated again
+            current = self.match.tick
+            self.rollbacks += 1
+            self.rolled_back_ticks += current - earliest
+            self.match.restore(self.snapshots[earliest])
+            for tick in range(earliest, current):
+                if self.match.over:
+                    break
+                if tick > earliest and tick > self.remote_confirmed:
+                    self.snapshots[tick] = self.match.snapshot()
+                self.match.step(self.actions_for(tick))
+
+        for tick in [tick for tick in self.snapshots if tick <= self.remote_confirmed]:
+            del self.snapshots[tick]
+
+
+class RelayServer:
+    # Pairs the first two clients joining the same room and from then on copies each one's bytes to the other.
+    # The relay never looks at game state, so a single process can carry hundreds of matches
+    def __init__(self):
+        self.waiting = {}
+        self.active = 0
+        self.matches = 0
+
+    async def serve(self, host="127.0.0.1", port=PORT):
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader, writer):
+        try:
+            message = await read_message(reader)
+        except (asyncio.IncompleteReadError, ValueError):
+            writer.close()
+            return
+        if message[:1] != bytes([JOIN]):
+            writer.close()
+            return
+        room, _ = decode_varint(message, 1)
+
+        waiting = self.waiting.pop(room, None)
+        if waiting is not None and (waiting[0].is_closing() or waiting[1].done()):
+            # A waiter whose connection is going away, its handler stops on the cancelled future
+            waiting[1].cancel()
+            waiting = None
+        if waiting is None:
+            partner = asyncio.get_running_loop().create_future()
+            self.waiting[room] = (writer, partner)
+            # A client sends nothing until the match starts, so reading while waiting sees it hang up. The read
+            # is left running once a partner comes and its bytes are the first ones relayed
+            reading = asyncio.ensure_future(reader.read(65536))
+            try:
+                await asyncio.wait((partner, reading), return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                reading.cancel()
+                self.drop_waiting(room, partner)
+                writer.close()
+                raise
+            if not partner.done() or partner.cancelled():
+                reading.cancel()
+                self.drop_waiting(room, partner)
+                writer.close()
+                return
+            partner_writer = partner.result()
+        else:
+            partner_writer, partner = waiting
+            seed = random.getrandbits(32)
+            partner_writer.write(frame(bytes([START, 0]) + encode_varint(seed)))
+            writer.write(frame(bytes([START, 1]) + encode_varint(seed)))
+            partner.set_result(writer)
+            self.matches += 1
+            reading = reader.read(65536)
+
+        self.active += 1
+        try:
+            while True:
+                data = await reading
+                if not data:
+                    break
+                partner_writer.write(data)
+                await partner_writer.drain()
+                reading = reader.read(65536)
+        except ConnectionError:
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+            partner_writer.close()
+
+    def drop_waiting(self, room, partner):
+        # Forgets a waiting client, unless someone else has taken its place in the room already
+        waiting = self.waiting.get(room)
+        if waiting is not None and waiting[1] is partner:
+            del self.waiting[room]
+        partner.cancel()
+
+
+class VersusClient:
+    # Plays one side of a match through a relay. policy(game) gives the local action for every tick
+    def __init__(self, policy, host="127.0.0.1", port=PORT, room=0):
+        self.policy = policy
+        self.host = host
+        self.port = port
+        self.room = room
+        self.session = None
+        self.closed = False
+        self.stalled_ticks = 0
+
+    async def play(self, realtime=True):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(frame(bytes([JOIN]) + encode_varint(self.room)))
+            message = await read_message(reader)
+            if message[0] != START:
+                raise ValueError("Expected the match to start")
+            seed, _ = decode_varint(message, 2)
+            self.session = RollbackSession(seed, message[1])
+            received = asyncio.Event()
+            receiver = asyncio.create_task(self.receive(reader, received))
+            try:
+                await self.run(writer, received, realtime)
+            finally:
+                receiver.cancel()
+            return self.session
+        finally:
+            writer.close()
+
+    async def receive(self, reader, received):
+        try:
+            while True:
+                message = await read_message(reader)
+                if message[0] == INPUT:
+                    self.session.receive(message)
+                    received.set()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.closed = True
+            received.set()
+
+    async def run(self, writer, received, realtime):
+        session = self.session
+        game = session.match.games[session.player]
+        next_tick = time.perf_counter()
+        while not session.finished:
+            if session.match.over or not session.can_advance():
+                # Waiting on the opponent, who needs our confirmed ticks to make progress as well
+                if self.closed:
+                    raise ConnectionError("Opponent left the match")
+                self.send(writer, force=True)
+                received.clear()
+                await received.wait()
+                self.stalled_ticks += 1
+                continue
+            if not game.game_over:
+                session.add_local(self.policy(game))
+            session.advance()
+            self.send(writer)
+            if realtime:
+                next_tick += TICK_MS / 1000
+                await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+            else:
+                await asyncio.sleep(0)
+        self.send(writer, force=True)
+        await writer.drain()
+
+    def send(self, writer, force=False):
+        message = self.session.outgoing(force)
+        if message is not None:
+            writer.write(frame(message))
+
+
+def bot_policy(seed):
+    # Presses a random key on about one tick in twelve
+    rng = random.Random(seed)
+    actions = (MOVE_LEFT, MOVE_RIGHT, ROTATE, SOFT_DROP, HARD_DROP)
+
+    def policy(game):
+        return rng.choice(actions) if rng.random() < 1 / 12 else NONE
+    return policy
+
+
+async def run_bots(matches, host, port, realtime, first_room=0, relay=None):
+    # Plays matches between bots through a relay and checks both sides of every match agree. Without a relay
+    # given, bots connect to one already running at host and port
+    server = await relay.serve(host, port) if relay is not None else None
+    start = time.perf_counter()
+    clients = [VersusClient(bot_policy(first_room * 2 + index), host, port, first_room + index // 2)
+               for index in range(2 * matches)]
+    sessions = await asyncio.gather(*(client.play(realtime) for client in clients))
+    elapsed = time.perf_counter() - start
+    if server is not None:
+        while relay.active:
+            await asyncio.sleep(0.01)
+        server.close()
+        await server.wait_closed()
+
+    desyncs = sum(sessions[index].match.checksum() != sessions[index + 1].match.checksum()
+                  for index in range(0, len(sessions), 2))
+    ticks = sum(session.match.tick for session in sessions)
+    print(f"matches {matches} in {elapsed:.1f} s, desyncs {desyncs}")
+    print(f"ticks per second {ticks / elapsed:.0f}, mean match length {ticks / len(sessions) / 60:.1f} s")
+    print(f"rollbacks {sum(session.rollbacks for session in sessions)}, "
+          f"re-simulated ticks {sum(session.rolled_back_ticks for session in sessions)}, "
+          f"stalls {sum(client.stalled_ticks for client in clients)}")
+    return desyncs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Versus relay server and loopback bot matches.")
+    parser.add_argument("mode", choices=("server", "bots"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--matches", type=int, default=100, help="bot matches played at the same time")
+    parser.add_argument("--first-room", type=int, default=0, help="room of the first bot match")
+    parser.add_argument("--connect", action="store_true", help="bots use a running relay instead of their own")
+    parser.add_argument("--fast", action="store_true", help="bots tick as fast as lockstep allows")
+    options = parser.parse_args()
+
+    if options.mode == "server":
+        async def serve_forever():
+            server = await RelayServer().serve(options.host, options.port)
+            async with server:
+                await server.serve_forever()
+        asyncio.run(serve_forever())
+    else:
+        relay = None if options.connect else RelayServer()
+        desyncs = asyncio.run(run_bots(options.matches, options.host, options.port, not options.fast,
+                                       options.first_room, relay))
+        raise SystemExit(1 if desyncs else 0)